@@ -0,0 +1,577 @@
+# acquisition.py
+"""Acquisition process publishing CAN samples to the GUI through shared memory.
+
+    python acquisition.py --name buscan --channel can0 [--record session.bin]
+    python main_ihm.py --acquisition buscan
+
+The acquisition process owns CANInterface, the polling tasks, the recorder
+and the closed-loop motor control (motor_control). Each reply frame (0x08, 0x09) is decoded and written into a
+`multiprocessing.shared_memory` ring; the GUI only reads it, so a slow redraw
+or a GUI restart never stalls reception. The sensors are polled from launch
+on by a PollScheduler of this process (staggered starts, bus-load budget);
+an attached GUI only changes its rates and payloads, and detaching leaves
+it running.
+
+Shared memory layout:
+    header   HEADER_DTYPE (ring head, heartbeat, GUI commands)
+    status   JSON text (latency and motor loop statistics), STATUS_SIZE bytes
+    slots    `capacity` x slot dtype
+
+Each slot carries its own sequence number (seqlock): it is odd while the
+slot is written and 2*(index+1) once complete, so a reader can detect torn
+or overwritten slots without any lock between processes. The status, poll
+command and motor control blocks are guarded the same way by their
+`*_seq` counter, and a reader retries while it is odd or changed.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import can
+
+from can_interface import DispatchTable
+from motor_control import DEFAULT_GAINS
+from poll_scheduler import BITRATE, LOAD_BUDGET, SENSORS, PollScheduler, PolledSensor
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"BUSCANS3"
+MAX_VALUES = 4
+MAX_POLLS = 8
+STATUS_SIZE = 4096
+NO_POLL = -1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"), ("capacity", "<u8"), ("data_size", "<u8"),
+    ("head", "<u8"),            # samples ever written
+    ("owner_pid", "<u8"),       # acquisition process
+    ("heartbeat", "<f8"),       # last loop time of the acquisition process
+    # Desired polling state, written by the GUI (latest wins)
+    ("cmd_seq", "<u8"), ("cmd_poll_id", "<i8", MAX_POLLS), ("cmd_period", "<f8", MAX_POLLS),
+    ("cmd_len", "<u8", MAX_POLLS), ("cmd_data", "u1", (MAX_POLLS, 8)),
+    # Closed-loop motor control, written by the GUI
+    ("ctrl_seq", "<u8"), ("ctrl_enabled", "<u8"), ("ctrl_target", "<f8"), ("ctrl_gains", "<f8", 3),
+    ("status_seq", "<u8"), ("status_len", "<u8"),
+])
+HEADER_SIZE = 512
+assert HEADER_DTYPE.itemsize <= HEADER_SIZE
+
+
+def slot_dtype(data_size=8):
+    return np.dtype([
+        ("seq", "<u8"), ("timestamp", "<f8"), ("can_id", "<u4"), ("dlc", "u1"),
+        ("n_values", "u1"), ("data", "u1", data_size), ("values", "<f8", MAX_VALUES),
+    ], align=True)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True         # exists, owned by another user
+    return True
+
+
+def _reclaim(name):
+    """Unlink the segment `name` left by an acquisition process that is gone.
+
+    Raises FileExistsError if its owner process still exists, even stalled
+    (or the segment is not a sample ring): it is never pulled from under a
+    live process.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    try:
+        error = None
+        if shm.size < HEADER_DTYPE.itemsize:
+            error = f"shared memory '{name}' exists and is not a sample ring"
+        else:
+            header = np.ndarray((), HEADER_DTYPE, buffer=shm.buf)
+            magic, pid, heartbeat = bytes(header["magic"]), int(header["owner_pid"]), float(header["heartbeat"])
+            del header
+            age = time.time() - heartbeat
+            if magic != MAGIC:
+                error = (f"shared memory '{name}' exists and is not a sample ring of this version, "
+                         f"remove /dev/shm/{name} if it is stale")
+            elif pid != os.getpid() and _pid_alive(pid):
+                error = (f"shared memory '{name}' is in use by acquisition process {pid} "
+                         f"(heartbeat {age:.1f} s ago), stop it first")
+        if error is not None:
+            # not ours to unlink: keep the resource tracker away from it
+            resource_tracker.unregister(shm._name, "shared_memory")
+            raise FileExistsError(error)
+        log.warning("⚠️ Reclaiming stale shared memory '%s' (process %d, heartbeat %.0f s ago)",
+                    name, pid, age)
+        shm.unlink()
+    finally:
+        shm.close()
+
+
+class SampleRing:
+    """Shared-memory ring of decoded samples (one writer process).
+
+    Creating a ring reclaims a segment of the same name only once its owner
+    is gone (process exited or no heartbeat for STALE_AFTER s).
+    """
+    def __init__(self, name, capacity=65536, data_size=8, create=False):
+        slots = slot_dtype(data_size)
+        size = HEADER_SIZE + STATUS_SIZE + capacity * slots.itemsize
+        if create:
+            _reclaim(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # the creator owns the segment: do not unlink it when this process exits
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.owner = create
+
+        buf = self.shm.buf
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=buf, offset=0)
+        if create:
+            self.header[()] = np.zeros((), HEADER_DTYPE)
+            self.header["magic"] = MAGIC
+            self.header["capacity"] = capacity
+            self.header["data_size"] = data_size
+            self.header["cmd_poll_id"] = NO_POLL
+            self.header["owner_pid"] = os.getpid()
+            self.header["heartbeat"] = time.time()
+        elif bytes(self.header["magic"]) != MAGIC:
+            raise ValueError(f"shared memory '{name}' is not a sample ring")
+        else:
+            capacity = int(self.header["capacity"])
+            slots = slot_dtype(int(self.header["data_size"]))
+
+        self.capacity = capacity
+        self.data_size = int(self.header["data_size"])
+        self.status = np.ndarray((STATUS_SIZE,), np.uint8, buffer=buf, offset=HEADER_SIZE)
+        self.slots = np.ndarray((capacity,), slots, buffer=buf, offset=HEADER_SIZE + STATUS_SIZE)
+
+    # ----------------------------------------------------------------
+    # Writer (acquisition process)
+    # ----------------------------------------------------------------
+    def publish(self, timestamp, can_id, data, values=()):
+        index = int(self.header["head"])
+        slot = self.slots[index % self.capacity]
+        slot["seq"] = 2 * index + 1                 # writing
+        slot["timestamp"] = timestamp
+        slot["can_id"] = can_id
+        n = min(len(data), self.data_size)
+        slot["dlc"] = n
+        slot["data"][:n] = data[:n]
+        n_values = min(len(values), MAX_VALUES)
+        slot["n_values"] = n_values
+        slot["values"][:n_values] = values[:n_values]
+        slot["seq"] = 2 * index + 2                 # complete
+        self.header["head"] = index + 1
+
+    def publish_samples(self, timestamps, can_id, payloads, values):
+        """Publish n samples of one frame at once.
+
+        `timestamps` (n,), `payloads` (n, size) uint8 and `values` (n, k)
+        arrays, as decoded by MessageDef.decode_samples.
+        """
+        n = len(timestamps)
+        head = int(self.header["head"])
+        seq = 2 * np.arange(head, head + n, dtype=np.uint64)
+        index = np.arange(head, head + n) % self.capacity
+        slots = self.slots
+        slots["seq"][index] = seq + 1               # writing
+        slots["timestamp"][index] = timestamps
+        slots["can_id"][index] = can_id
+        size = min(payloads.shape[1], self.data_size)
+        slots["dlc"][index] = size
+        slots["data"][index, :size] = payloads[:, :size]
+        k = min(values.shape[1], MAX_VALUES)
+        slots["n_values"][index] = k
+        slots["values"][index, :k] = values[:, :k]
+        slots["seq"][index] = seq + 2               # complete
+        self.header["head"] = head + n
+
+    def write_status(self, status):
+        raw = json.dumps(status).encode()[:STATUS_SIZE]
+        self.header["status_seq"] += 1              # odd: writing
+        self.status[:len(raw)] = np.frombuffer(raw, np.uint8)
+        self.header["status_len"] = len(raw)
+        self.header["status_seq"] += 1
+
+    # ----------------------------------------------------------------
+    # Reader (GUI process)
+    # ----------------------------------------------------------------
+    def read_since(self, index):
+        """Samples written after sample `index`.
+
+        Returns (list of (timestamp, can_id, data bytes, values tuple), new
+        index, lost samples).
+        """
+        head = int(self.header["head"])
+        lost = max(0, head - self.capacity - index)
+        index += lost
+        samples = []
+        for i in range(index, head):
+            slot = self.slots[i % self.capacity]
+            seq = int(slot["seq"])
+            sample = (float(slot["timestamp"]), int(slot["can_id"]),
+                      bytes(slot["data"][:slot["dlc"]]),
+                      tuple(slot["values"][:slot["n_values"]].tolist()))
+            if seq != 2 * i + 2 or int(slot["seq"]) != seq:
+                lost += 1                           # overwritten meanwhile
+                continue
+            samples.append(sample)
+        return samples, head, lost
+
+    def _read_consistent(self, seq_field, read, retries=3):
+        """(seq, read()) once `read` ran while `seq_field` was even and unchanged.
+
+        None if the writer kept the block busy for every retry.
+        """
+        for _ in range(retries):
+            seq = int(self.header[seq_field])
+            if seq % 2:
+                time.sleep(0.001)
+                continue
+            value = read()
+            if int(self.header[seq_field]) == seq:
+                return seq, value
+        return None
+
+    def read_status(self):
+        def read():
+            return bytes(self.status[:int(self.header["status_len"])])
+        result = self._read_consistent("status_seq", read)
+        return json.loads(result[1]) if result and result[1] else {}
+
+    def send_command(self, polls):
+        """Set the desired polling state (GUI side): {can_id: (data, period)}"""
+        if len(polls) > MAX_POLLS:
+            raise ValueError(f"at most {MAX_POLLS} periodic requests")
+        h = self.header
+        h["cmd_seq"] += 1                           # odd: writing
+        h["cmd_poll_id"] = NO_POLL
+        for i, (can_id, (data, period)) in enumerate(polls.items()):
+            n = min(len(data), 8)
+            h["cmd_poll_id"][i] = can_id
+            h["cmd_period"][i] = period
+            h["cmd_len"][i] = n
+            h["cmd_data"][i, :n] = list(data)[:n]
+        h["cmd_seq"] += 1
+
+    def command(self):
+        """(seq, {poll_id: (payload, period)}) as set by the GUI, None if torn"""
+        h = self.header
+
+        def read():
+            polls = {}
+            for i in range(MAX_POLLS):
+                can_id = int(h["cmd_poll_id"][i])
+                if can_id != NO_POLL:
+                    n = int(h["cmd_len"][i])
+                    polls[can_id] = (h["cmd_data"][i, :n].tolist(), float(h["cmd_period"][i]))
+            return polls
+        return self._read_consistent("cmd_seq", read)
+
+    def send_control(self, enabled, target, gains):
+        """Set the motor loop state (GUI side)"""
+        h = self.header
+        h["ctrl_seq"] += 1                          # odd: writing
+        h["ctrl_enabled"] = int(enabled)
+        h["ctrl_target"] = target
+        h["ctrl_gains"] = gains
+        h["ctrl_seq"] += 1
+
+    def control(self):
+        """(seq, (enabled, target, gains)) as set by the GUI, None if torn"""
+        h = self.header
+
+        def read():
+            return bool(h["ctrl_enabled"]), float(h["ctrl_target"]), tuple(h["ctrl_gains"].tolist())
+        return self._read_consistent("ctrl_seq", read)
+
+    def close(self):
+        self.header = self.status = self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ================================================================
+# GUI side: CANInterface look-alike reading the ring
+# ================================================================
+class RemoteMotorControl:
+    """MotorController look-alike: the loop runs in the acquisition process"""
+    def __init__(self, ring, gains=DEFAULT_GAINS):
+        self.ring = ring
+        self.enabled = False
+        self.target = 0.0
+        self.gains = tuple(gains)
+
+    def _publish(self):
+        self.ring.send_control(self.enabled, self.target, self.gains)
+
+    def enable(self, target=None):
+        if target is not None:
+            self.target = float(target)
+        self.enabled = True
+        self._publish()
+
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            self._publish()
+
+    def set_target(self, rpm):
+        self.target = float(rpm)
+        self._publish()
+
+    def set_gains(self, kp, ki, kd):
+        self.gains = (kp, ki, kd)
+        self._publish()
+
+    def stats(self):
+        return self.ring.read_status().get("motor", {})
+
+
+class RemoteCANInterface:
+    """Subset of the CANInterface API backed by an acquisition process.
+
+    Received samples are turned back into `can.Message`s and dispatched to
+    the registered callbacks from a polling thread; periodic requests are
+    forwarded to the acquisition process as commands.
+    """
+    def __init__(self, name, poll_interval=0.002):
+        self.ring = SampleRing(name)
+        self.channel = f"shm:{name}"
+        self.dispatch = DispatchTable()
+        self.motor = RemoteMotorControl(self.ring)
+        self.recorder = None
+        self.exporter = None
+        self.poll_interval = poll_interval
+        self.lost = 0
+        # can_id -> (payload, period), as last sent: the GUI changes the
+        # schedule the acquisition is already running
+        command = self.ring.command()
+        self._periodic = command[1] if command else {}
+        # start with what the ring still holds: a restarted GUI gets the backlog
+        self._index = max(0, int(self.ring.header["head"]) - self.ring.capacity)
+        self.running = True
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+        log.info("🔗 Attached to acquisition '%s' (%d samples available)",
+                 name, int(self.ring.header["head"]) - self._index)
+
+    def _read_loop(self):
+        while self.running:
+            samples, self._index, lost = self.ring.read_since(self._index)
+            self.lost += lost
+            for timestamp, can_id, data, _ in samples:
+                self.dispatch.dispatch(can.Message(
+                    timestamp=timestamp, arbitration_id=can_id, data=data, is_extended_id=False))
+            time.sleep(self.poll_interval)
+
+    def alive(self, timeout=1.0):
+        """True if the acquisition process looped within `timeout` s"""
+        return time.time() - float(self.ring.header["heartbeat"]) < timeout
+
+    def add_callback(self, callback, can_id=None, mask=None):
+        if callable(callback):
+            self.dispatch.add(callback, can_id, mask)
+
+    def remove_callback(self, callback):
+        self.dispatch.remove(callback)
+
+    def inject(self, msg):
+        self.dispatch.dispatch(msg)
+
+    def start_periodic(self, can_id, data, period=0.01):
+        self._periodic[can_id] = (list(data), period)
+        self.ring.send_command(self._periodic)
+        return self._periodic[can_id]
+
+    def update_periodic(self, can_id, data):
+        if can_id not in self._periodic:
+            return False
+        self.start_periodic(can_id, data, self._periodic[can_id][1])
+        return True
+
+    def stop_periodic(self, can_id=None):
+        if can_id is None:
+            self._periodic.clear()
+        elif self._periodic.pop(can_id, None) is None:
+            return
+        self.ring.send_command(self._periodic)
+
+    def send_message(self, can_id, data):
+        log.warning("⚠️ send_message() is not available through the acquisition process")
+
+    def track_round_trip(self, request_id, reply_id, period=None):
+        pass   # measured by the acquisition process, see latency_stats()
+
+    def latency_stats(self):
+        return {int(k): v for k, v in self.ring.read_status().get("latency", {}).items()}
+
+    def start_recording(self, path, capacity=1_000_000):
+        log.warning("⚠️ Recording is done by the acquisition process (--record)")
+
+    def stop_recording(self):
+        pass
+
+    def start_export(self, directory, **options):
+        """Export the samples received from the acquisition process, see data_export"""
+        from data_export import ColumnarExporter
+        self.stop_export()
+        self.exporter = ColumnarExporter(directory, **options)
+        self.exporter.attach(self)
+        return self.exporter
+
+    def stop_export(self):
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+    def close(self):
+        """Detach (the acquisition process keeps running)"""
+        self.stop_export()
+        self.running = False
+        self.thread.join(timeout=1.0)
+        self.ring.close()
+
+
+# ================================================================
+# Acquisition process
+# ================================================================
+def start_polling(iface, poll_rates=None, bitrate=BITRATE, fd=False, data_bitrate=None):
+    """PollScheduler of the acquisition process, started with every sensor of SENSORS"""
+    poll_rates = poll_rates or {}
+    scheduler = PollScheduler(iface, bitrate, LOAD_BUDGET, data_bitrate=data_bitrate)
+    for sensor_name, (request_id, reply_id, reply_dlc, rate, priority) in SENSORS.items():
+        rate = poll_rates.get(sensor_name, rate)
+        if rate <= 0:
+            continue
+        if reply_id is not None:
+            iface.track_round_trip(request_id, reply_id, 1.0 / rate)
+        payload = [0] if request_id in (0x01, 0x03) else [1]    # motor stopped
+        scheduler.add(PolledSensor(sensor_name, request_id, rate, payload, reply_id,
+                                   64 if fd else reply_dlc, priority, fd=fd))
+    scheduler.start()
+    return scheduler
+
+
+def run_acquisition(name, channel='can0', bustype='socketcan', record=None,
+                    capacity=65536, poll_rates=None, stop_event=None, metrics_port=None, fd=False,
+                    export=None, bitrate=BITRATE, data_bitrate=None):
+    """Own the bus and publish replies until Ctrl-C / `stop_event`"""
+    from can_interface import CANInterface
+    from can_signals import MESSAGES
+    from motor_control import MotorController
+
+    ring = SampleRing(name, capacity, create=True)
+    iface = CANInterface(channel, bustype, fd=fd)
+    if record:
+        iface.start_recording(record)
+    if export:
+        iface.start_export(export)
+    server = None
+    if metrics_port:
+        from bus_metrics import serve_metrics
+        server = serve_metrics([iface.metrics], metrics_port)
+
+    def publish(msg):
+        definition = MESSAGES.get(msg.arbitration_id)
+        if definition is None or len(msg.data) < definition.length:
+            ring.publish(msg.timestamp, msg.arbitration_id, msg.data)
+            return
+        # one slot per sample: CAN FD frames may carry several packed samples,
+        # decoded in one pass
+        times, columns = definition.decode_samples(msg.data, msg.timestamp)
+        payloads = np.frombuffer(msg.data, np.uint8, len(times) * definition.length)
+        values = np.column_stack([columns[name] for name in definition.names]).astype(float, copy=False)
+        ring.publish_samples(times, msg.arbitration_id, payloads.reshape(len(times), definition.length),
+                             values)
+
+    for can_id in MESSAGES:
+        iface.add_callback(publish, can_id=can_id)
+    log.info("📡 Acquisition '%s' running on %s", name, channel)
+
+    scheduler = start_polling(iface, poll_rates, bitrate, fd, data_bitrate)
+    ring.send_command(scheduler.polls())   # what an attaching GUI starts from
+
+    motor = MotorController(iface)
+    applied_seq = ring.command()[0]
+    control_seq = 0
+    last_status = 0.0
+    stop_event = stop_event or threading.Event()
+    try:
+        while not stop_event.is_set():
+            command = ring.command()            # None: being written, next loop
+            if command is not None and command[0] != applied_seq:
+                applied_seq, polls = command
+                scheduler.apply(polls)
+
+            control = ring.control()
+            if control is not None and control[0] != control_seq:
+                seq, (enabled, target, gains) = control
+                motor.set_gains(*gains)
+                if enabled:
+                    motor.enable(target)
+                else:
+                    motor.disable()
+                control_seq = seq
+
+            now = time.time()
+            ring.header["heartbeat"] = now
+            if now - last_status > 0.25:
+                ring.write_status({"latency": iface.latency_stats(), "motor": motor.stats()})
+                last_status = now
+            time.sleep(0.01)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        motor.disable()
+        scheduler.stop()
+        if server is not None:
+            server.shutdown()
+        iface.close()
+        ring.close()
+        log.info("🛑 Acquisition '%s' stopped", name)
+
+
+if __name__ == '__main__':
+    import argparse
+    from bus_logging import setup_logging
+    from can_signals import MPU_ANGLES, MPU_SAMPLE_PERIOD, set_sample_periods
+
+    parser = argparse.ArgumentParser(description="CAN acquisition process")
+    parser.add_argument("--name", default="buscan", help="shared memory name")
+    parser.add_argument("--channel", default="can0")
+    parser.add_argument("--bustype", default="socketcan")
+    parser.add_argument("--record", metavar="FILE", help="record the session (bus_recorder format)")
+    parser.add_argument("--capacity", type=int, default=65536, help="samples kept in shared memory")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--fd", action="store_true", help="use CAN FD (bitrate switching)")
+    parser.add_argument("--mpu-sample-period", type=float, default=MPU_SAMPLE_PERIOD, metavar="S",
+                        help="time between the MPU samples packed in a CAN FD reply (assumed 1 ms)")
+    parser.add_argument("--export", metavar="DIR", help="export the decoded signals (data_export format)")
+    parser.add_argument("--poll-rate", metavar="SENSOR=HZ", action="append", default=[],
+                        help=f"poll rate of a sensor ({', '.join(SENSORS)}), 0 = not polled")
+    parser.add_argument("--bitrate", type=int, default=BITRATE, help="bus bitrate, for the load estimate")
+    parser.add_argument("--data-bitrate", type=int, help="CAN FD data bitrate, for the load estimate")
+    args = parser.parse_args()
+    set_sample_periods({MPU_ANGLES.can_id: args.mpu_sample_period})
+    poll_rates = {}
+    for item in args.poll_rate:
+        sensor, _, rate = item.partition("=")
+        if sensor not in SENSORS:
+            parser.error(f"unknown sensor '{sensor}'")
+        poll_rates[sensor] = float(rate)
+    setup_logging(logging.WARNING)
+    run_acquisition(args.name, args.channel, args.bustype, args.record, args.capacity, poll_rates,
+                    metrics_port=args.metrics_port, fd=args.fd, export=args.export,
+                    bitrate=args.bitrate, data_bitrate=args.data_bitrate)
@@ -0,0 +1,370 @@
+# analysis.py
+"""Offline analysis of bus_recorder recordings.
+
+Recordings are memory-mapped as NumPy record arrays (`record_dtype`), cut
+in chunks of `--chunk-frames` frames and analysed by a pool of worker
+processes; nothing is replayed and no `can.Message` is built. Each worker
+decodes the dashboard signals of its chunk (can_signals: MPU angles, wind
+speed, packed CAN FD samples included) and returns mergeable partial
+results: counts, sums, exact histograms of the raw integer values, log
+histograms of gaps. The parent merges them, in chunk order.
+
+Summaries:
+  * frames and rate per ID
+  * per signal: min / mean / max, percentiles, histogram, max rate of change
+  * request -> reply gaps (0x02 -> 0x08, 0x03 -> 0x09)
+  * RPM distribution per commanded motor speed (0x03 payload -> 0x09 RPM)
+
+    python analysis.py run12.rec --id 0x08 --from 60 --to 120
+    python analysis.py day/*.rec --workers 8 -o summary.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bus_recorder import FLAG_TX, HEADER_SIZE, read_header, record_dtype
+from can_signals import MESSAGES, MPU_ANGLES, MPU_SAMPLE_PERIOD, set_sample_periods
+from latency_stats import LatencyHistogram
+
+MOTOR_COMMAND_ID = 0x03
+RPM_REPLY_ID = 0x09
+REQUESTS = {0x08: 0x02, 0x09: 0x03}    # reply ID -> request ID
+PERCENTILES = (1, 5, 50, 95, 99)
+LOOKBACK = 1 << 20                      # frames searched before a chunk for the last request
+GAP_HISTOGRAM = LatencyHistogram()      # bucket layout of the gap histograms
+
+
+# ================================================================
+# Recording access
+# ================================================================
+class Recording:
+    """Memory-mapped recording, indexed in logical (oldest first) order"""
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.capacity = self.header["capacity"]
+        self.first = self.header["first"]
+        self.count = self.header["count"]
+        self.records = np.memmap(path, record_dtype(self.header["data_size"]), "r",
+                                 HEADER_SIZE, (self.capacity,))
+
+    def take(self, start, stop, field=None):
+        """Frames [start, stop) in logical order (a copy, at most two slices)"""
+        records = self.records if field is None else self.records[field]
+        a, b = start % self.capacity, (stop - 1) % self.capacity + 1
+        if stop <= start:
+            return records[:0].copy()
+        if a < b:
+            return np.array(records[a:b])
+        return np.concatenate([records[a:], records[:b]])
+
+    def timestamp(self, index):
+        return float(self.records["timestamp"][index % self.capacity])
+
+    def bisect(self, t):
+        """First logical index with a timestamp >= t (timestamps increase)"""
+        lo, hi = self.first, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def last_before(self, index, can_id, limit=LOOKBACK, block=65536):
+        """Last frame of `can_id` before logical `index`, as a 1-frame array.
+
+        Searched back `limit` frames at most; None if not found.
+        """
+        stop = index
+        floor = max(self.first, index - limit)
+        while stop > floor:
+            start = max(floor, stop - block)
+            ids = self.take(start, stop, "can_id")
+            hits = np.flatnonzero(ids == can_id)
+            if len(hits):
+                return self.take(start + hits[-1], start + hits[-1] + 1)
+            stop = start
+        return None
+
+
+# ================================================================
+# Worker side
+# ================================================================
+def decode_frames(definition, frames):
+    """(t, {signal: array}) of the frames of one message, packed samples unrolled"""
+    times, columns = [], []
+    for dlc in np.unique(frames["dlc"]):
+        n = int(dlc) // definition.length
+        if n == 0:
+            continue
+        group = frames[frames["dlc"] == dlc]
+        payloads = np.ascontiguousarray(group["data"][:, :n * definition.length])
+        times.append((group["timestamp"][:, None] + definition.sample_times(0.0, n)[None, :]).ravel())
+        columns.append(definition.decode_array(payloads.reshape(len(group) * n, definition.length)))
+    if not times:
+        return np.zeros(0), {name: np.zeros(0) for name in definition.names}
+    t = np.concatenate(times)
+    order = np.argsort(t, kind="stable")
+    return t[order], {name: np.concatenate([c[name] for c in columns])[order]
+                      for name in definition.names}
+
+
+def _value_histogram(signal, values):
+    """Exact histogram of a raw 8/16-bit signal: (offset, counts)"""
+    if not signal.is_raw or signal.size > 2:
+        return None
+    offset = -(1 << (8 * signal.size - 1)) if signal.signed else 0
+    return offset, np.bincount(values.astype(np.int64) - offset, minlength=1 << (8 * signal.size))
+
+
+def _gap_histogram(gaps):
+    h = GAP_HISTOGRAM
+    index = np.log10(np.maximum(gaps, h.min_value) / h.min_value) * h.buckets_per_decade
+    index = np.clip(index.astype(np.int64), 0, h.nbuckets - 1)
+    return np.bincount(index, minlength=h.nbuckets), float(gaps.sum()), float(gaps.max(initial=0.0))
+
+
+def _signal_partial(signal, t, values):
+    partial = {"count": len(values)}
+    if not len(values):
+        return partial
+    v = values.astype(np.float64)
+    partial.update(sum=float(v.sum()), min=float(v.min()), max=float(v.max()),
+                   first=(float(t[0]), float(v[0])), last=(float(t[-1]), float(v[-1])),
+                   histogram=_value_histogram(signal, values), max_rate=None)
+    dt = np.diff(t)
+    ok = dt > 0
+    if ok.any():
+        rates = np.abs(np.diff(v)[ok] / dt[ok])
+        i = int(rates.argmax())
+        partial["max_rate"] = (float(rates[i]), float(t[1:][ok][i]))
+    return partial
+
+
+def analyse_chunk(task):
+    """Partial results of the logical frames [start, stop) of a recording"""
+    path, start, stop, ids = task
+    rec = Recording(path)
+    frames = rec.take(start, stop)
+    result = {"path": path, "ids": {}, "signals": {}, "gaps": {}, "command_rpm": None}
+
+    for can_id in ids:
+        selected = frames[frames["can_id"] == can_id]
+        if not len(selected):
+            continue
+        t = selected["timestamp"]
+        result["ids"][can_id] = {"frames": len(selected), "rx": int(((selected["flags"] & FLAG_TX) == 0).sum()),
+                                 "first": float(t[0]), "last": float(t[-1])}
+        definition = MESSAGES.get(can_id)
+        if definition is None:
+            continue
+        st, values = decode_frames(definition, selected)
+        for signal in definition.signals:
+            result["signals"][(definition.name, signal.name)] = _signal_partial(signal, st, values[signal.name])
+
+        request_id = REQUESTS.get(can_id)
+        if request_id is not None and request_id in ids:
+            requests = frames["timestamp"][frames["can_id"] == request_id]
+            previous = rec.last_before(start, request_id)
+            if previous is not None:
+                requests = np.concatenate([previous["timestamp"], requests])
+            index = np.searchsorted(requests, t, "right") - 1
+            answered = index >= 0
+            result["gaps"][(request_id, can_id)] = _gap_histogram(t[answered] - requests[index[answered]])
+
+    if RPM_REPLY_ID in ids and MOTOR_COMMAND_ID in ids:
+        commands = frames[(frames["can_id"] == MOTOR_COMMAND_ID) & (frames["dlc"] >= 1)]
+        previous = rec.last_before(start, MOTOR_COMMAND_ID)
+        if previous is not None and previous["dlc"][0] >= 1:
+            commands = np.concatenate([previous, commands])
+        replies = frames[(frames["can_id"] == RPM_REPLY_ID) & (frames["dlc"] >= 1)]
+        index = np.searchsorted(commands["timestamp"], replies["timestamp"], "right") - 1
+        answered = index >= 0
+        pairs = (commands["data"][index[answered], 0].astype(np.int64) << 8) | replies["data"][answered, 0]
+        result["command_rpm"] = np.bincount(pairs, minlength=1 << 16)
+    return result
+
+
+# ================================================================
+# Parent side
+# ================================================================
+def plan_chunks(paths, ids, t_from=None, t_to=None, chunk_frames=1 << 20):
+    """Tasks for analyse_chunk(); `t_from`/`t_to` are seconds from the start of each recording"""
+    tasks = []
+    for path in paths:
+        rec = Recording(path)
+        if rec.count == rec.first:
+            continue
+        origin = rec.timestamp(rec.first)
+        start = rec.first if t_from is None else rec.bisect(origin + t_from)
+        stop = rec.count if t_to is None else rec.bisect(origin + t_to)
+        for a in range(start, stop, chunk_frames):
+            tasks.append((path, a, min(a + chunk_frames, stop), tuple(ids)))
+    return tasks
+
+
+def _percentiles(offset, counts, total):
+    cumulative = np.cumsum(counts)
+    return {f"p{p}": float(np.searchsorted(cumulative, p / 100.0 * total) + offset) for p in PERCENTILES}
+
+
+def merge(partials, bins=20):
+    """Merge the chunk results (in order) into the final summary"""
+    ids, signals, gaps = {}, {}, {}
+    command_rpm = None
+    for part in partials:
+        for can_id, p in part["ids"].items():
+            s = ids.setdefault(can_id, {"frames": 0, "rx": 0, "spans": {}})
+            s["frames"] += p["frames"]
+            s["rx"] += p["rx"]
+            span = s["spans"].setdefault(part["path"], [p["first"], p["last"]])
+            span[1] = p["last"]
+        for key, p in part["signals"].items():
+            if not p["count"]:
+                continue
+            s = signals.get(key)
+            if s is None:
+                signals[key] = dict(p, path=part["path"])
+                continue
+            s["count"] += p["count"]
+            s["sum"] += p["sum"]
+            s["min"] = min(s["min"], p["min"])
+            s["max"] = max(s["max"], p["max"])
+            if s["histogram"] is not None:
+                s["histogram"] = (s["histogram"][0], s["histogram"][1] + p["histogram"][1])
+            rates = [r for r in (s["max_rate"], p["max_rate"]) if r is not None]
+            # the change between two chunks of the same recording counts too
+            (t0, v0), (t1, v1) = s["last"], p["first"]
+            if s["path"] == part["path"] and t1 > t0:
+                rates.append((abs(v1 - v0) / (t1 - t0), t1))
+            s["max_rate"] = max(rates) if rates else None
+            s["last"], s["path"] = p["last"], part["path"]
+        for key, (counts, total, maximum) in part["gaps"].items():
+            g = gaps.get(key)
+            gaps[key] = (counts, total, maximum) if g is None else (g[0] + counts, g[1] + total, max(g[2], maximum))
+        if part["command_rpm"] is not None:
+            command_rpm = part["command_rpm"] if command_rpm is None else command_rpm + part["command_rpm"]
+
+    summary = {"ids": {}, "signals": {}, "gaps": {}, "rpm_by_command": {}}
+    for can_id, s in sorted(ids.items()):
+        duration = sum(last - first for first, last in s["spans"].values())
+        summary["ids"][f"0x{can_id:X}"] = {"frames": s["frames"], "rx": s["rx"], "duration": duration,
+                                           "rate_hz": s["frames"] / duration if duration else None}
+
+    for (message, name), s in signals.items():
+        out = {"count": s["count"], "min": s["min"], "mean": s["sum"] / s["count"], "max": s["max"]}
+        if s["max_rate"] is not None:
+            out["max_rate_per_s"], out["max_rate_time"] = s["max_rate"]
+        if s["histogram"] is not None:
+            offset, counts = s["histogram"]
+            out.update(_percentiles(offset, counts, s["count"]))
+            lo, hi = int(s["min"]) - offset, int(s["max"]) - offset + 1
+            edges = np.linspace(lo, hi, min(bins, hi - lo) + 1).round().astype(int)
+            out["histogram"] = [(int(a + offset), int(b + offset - 1), int(counts[a:b].sum()))
+                                for a, b in zip(edges[:-1], edges[1:])]
+        summary["signals"][f"{message}/{name}"] = out
+
+    for (request_id, reply_id), (counts, total, maximum) in sorted(gaps.items()):
+        h = LatencyHistogram()
+        h.counts, h.count, h.total, h.max = list(counts), int(counts.sum()), total, maximum
+        summary["gaps"][f"0x{request_id:X} -> 0x{reply_id:X}"] = h.snapshot()
+
+    if command_rpm is not None:
+        table = command_rpm.reshape(256, 256)
+        rpm = np.arange(256)
+        for command in np.flatnonzero(table.sum(axis=1)):
+            counts = table[command]
+            n = int(counts.sum())
+            summary["rpm_by_command"][int(command)] = dict(
+                {"samples": n, "mean": float((counts * rpm).sum() / n)},
+                **{k: v for k, v in _percentiles(0, counts, n).items() if k in ("p5", "p50", "p95")})
+    return summary
+
+
+def analyse(paths, ids=None, t_from=None, t_to=None, workers=None, chunk_frames=1 << 20, bins=20,
+            sample_periods=None):
+    """Analyse recordings, see the module docstring; returns the summary dict.
+
+    `sample_periods` ({CAN ID: seconds}) overrides the packed-sample periods
+    of can_signals, in this process and in the workers.
+    """
+    set_sample_periods(sample_periods)
+    ids = sorted(set(ids or (list(MESSAGES) + list(REQUESTS.values()))))
+    tasks = plan_chunks(paths, ids, t_from, t_to, chunk_frames)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) <= 1:
+        partials = [analyse_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(min(workers, len(tasks)), initializer=set_sample_periods,
+                                 initargs=(sample_periods,)) as pool:
+            partials = list(pool.map(analyse_chunk, tasks))
+    summary = merge(partials, bins)
+    summary["frames"] = sum(stop - start for _, start, stop, _ in tasks)
+    summary["chunks"] = len(tasks)
+    return summary
+
+
+def format_summary(summary):
+    lines = [f"{summary['frames']} frames analysed in {summary['chunks']} chunks"]
+    if summary["ids"]:
+        lines.append("\nFrames per ID:")
+        for can_id, s in summary["ids"].items():
+            rate = "–" if s["rate_hz"] is None else f"{s['rate_hz']:.1f} Hz"
+            lines.append(f"  {can_id:>6}  {s['frames']:10d} frames ({s['rx']} received)  {rate}")
+    for name, s in summary["signals"].items():
+        lines.append(f"\n{name}: {s['count']} samples, min {s['min']:g}, mean {s['mean']:.3f}, max {s['max']:g}")
+        if "p50" in s:
+            lines.append("  " + ", ".join(f"p{p} {s[f'p{p}']:g}" for p in PERCENTILES))
+        if "max_rate_per_s" in s:
+            lines.append(f"  max rate of change {s['max_rate_per_s']:.1f}/s at t={s['max_rate_time']:.3f}")
+        if "histogram" in s:
+            peak = max(n for _, _, n in s["histogram"]) or 1
+            for lo, hi, n in s["histogram"]:
+                lines.append(f"  {lo:7d} … {hi:7d} {n:10d} {'#' * int(40 * n / peak)}")
+    if summary["gaps"]:
+        lines.append("\nRequest -> reply gaps (ms):")
+        for name, g in summary["gaps"].items():
+            lines.append(f"  {name}: {g['count']} replies, " + ", ".join(
+                f"{k} {'–' if g[k] is None else f'{g[k] * 1000:.3f}'}" for k in ("p50", "p95", "p99", "max")))
+    if summary["rpm_by_command"]:
+        lines.append("\nRPM by commanded motor speed:")
+        lines.append(f"  {'command':>7} {'samples':>9} {'mean':>7} {'p5':>5} {'p50':>5} {'p95':>5}")
+        for command, s in summary["rpm_by_command"].items():
+            lines.append(f"  {command:7d} {s['samples']:9d} {s['mean']:7.1f} {s['p5']:5g} {s['p50']:5g} {s['p95']:5g}")
+    return "\n".join(lines)
+
+
+# ================================================================
+# Command line
+# ================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summaries of bus_recorder recordings")
+    parser.add_argument("paths", nargs="+", metavar="RECORDING")
+    parser.add_argument("--id", action="append", type=lambda s: int(s, 0), dest="ids",
+                        help="only this CAN ID (repeatable, e.g. --id 0x08)")
+    parser.add_argument("--from", type=float, dest="t_from", metavar="S",
+                        help="start, in seconds from the beginning of each recording")
+    parser.add_argument("--to", type=float, dest="t_to", metavar="S",
+                        help="end, in seconds from the beginning of each recording")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-frames", type=int, default=1 << 20, help="frames per worker task")
+    parser.add_argument("--bins", type=int, default=20, help="histogram bins per signal")
+    parser.add_argument("-o", "--output", help="write the summary as JSON to this file")
+    parser.add_argument("--mpu-sample-period", type=float, default=MPU_SAMPLE_PERIOD, metavar="S",
+                        help="time between the MPU samples packed in a CAN FD reply (assumed 1 ms)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = analyse(args.paths, args.ids, args.t_from, args.t_to, args.workers, args.chunk_frames, args.bins,
+                      {MPU_ANGLES.can_id: args.mpu_sample_period})
+    print(format_summary(summary))
+    print(f"\n({time.perf_counter() - started:.2f} s)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
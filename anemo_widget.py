@@ -1,8 +1,13 @@
 # anemo_widget.py
 from PyQt5 import QtWidgets, QtCore
 
+from latency_stats import format_ms
+
+
 class AnemoWidget(QtWidgets.QWidget):
     speedChanged = QtCore.pyqtSignal(int)  # emitted when slider changes
+    closedLoopChanged = QtCore.pyqtSignal(bool)
+    targetChanged = QtCore.pyqtSignal(int)  # target RPM of the closed loop
 
     def __init__(self):
         super().__init__()
@@ -29,14 +34,52 @@ class AnemoWidget(QtWidgets.QWidget):
         self.wind_speed_label.setAlignment(QtCore.Qt.AlignCenter)
         layout.addWidget(self.wind_speed_label)
 
+        # Closed loop: the motor command is computed from the RPM feedback
+        loop_layout = QtWidgets.QHBoxLayout()
+        self.closed_loop = QtWidgets.QCheckBox("Closed loop")
+        self.target = QtWidgets.QSpinBox()
+        self.target.setRange(0, 255)
+        self.target.setPrefix("Target ")
+        self.target.setSuffix(" RPM")
+        loop_layout.addWidget(self.closed_loop)
+        loop_layout.addWidget(self.target)
+        loop_layout.addStretch()
+        layout.addLayout(loop_layout)
+
+        self.loop_label = QtWidgets.QLabel("")
+        self.loop_label.setAlignment(QtCore.Qt.AlignCenter)
+        layout.addWidget(self.loop_label)
+
         # Connect slider to internal method
         self.slider.valueChanged.connect(self._on_value_changed)
+        self.closed_loop.toggled.connect(self._on_closed_loop)
+        self.target.valueChanged.connect(self.targetChanged.emit)
 
     def _on_value_changed(self, value):
         """Called when slider value changes."""
         self.value_label.setText(f"Motor Speed: {value}")
         self.speedChanged.emit(value)  # This can be connected to motor control
 
+    def _on_closed_loop(self, enabled):
+        self.slider.setEnabled(not enabled)
+        if not enabled:
+            self.loop_label.setText("")
+            self.value_label.setText(f"Motor Speed: {self.slider.value()}")
+        self.closedLoopChanged.emit(enabled)
+
     def update_wind_speed(self, rpm):
         """Call this to update the displayed windmill speed."""
         self.wind_speed_label.setText(f"Windmill Speed: {rpm} RPM")
+
+    def update_loop_stats(self, stats):
+        """Show the tracking error and timing of motor_control.MotorController.stats()"""
+        if not stats:
+            return
+        self.value_label.setText(f"Motor Command: {stats['command']}")
+        error, rms = stats["error"], stats["rms_error"]
+        loop = stats["loop_time"]
+        self.loop_label.setText(
+            f"Error: {'–' if error is None else f'{error:+.0f}'} RPM"
+            f" (RMS {'–' if rms is None else f'{rms:.1f}'})"
+            f" — loop p50 {format_ms(loop['p50'])} ms, p99 {format_ms(loop['p99'])} ms"
+            f" — {stats['rate_hz']:.0f} commands/s, {stats['timeouts']} timeouts")
@@ -0,0 +1,208 @@
+# async_can.py
+"""asyncio client for headless acquisition services.
+
+    async with AsyncCANInterface('can0') as iface:
+        reply = await iface.request(0x02, [1], expect=0x08, timeout=0.05)
+        async for msg in iface.frames(ids=[0x09]):
+            ...
+
+On socketcan the python-can Notifier watches the socket from the event loop
+itself (`loop.add_reader`), so there is no reader thread. Each subscriber gets
+a bounded queue; when it is full the subscription's drop policy decides
+which frame is lost, the bus itself is never blocked by a slow consumer.
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import can
+
+from can_interface import DispatchTable
+
+log = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"   # keep the most recent frames
+DROP_NEWEST = "drop_newest"   # keep the queued frames, discard the new one
+
+
+class Subscription:
+    """Bounded frame queue of one consumer"""
+    def __init__(self, ids=None, maxsize=1000, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"unknown drop policy {policy!r}")
+        self.ids = ids
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize)
+        self.received = 0
+        self.dropped = 0
+
+    def offer(self, msg):
+        """Queue a frame (event loop thread), applying the drop policy"""
+        self.received += 1
+        if self.queue.full():
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(msg)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class AsyncCANInterface:
+    """CAN bus driven by the running asyncio event loop.
+
+    Must be created from a coroutine (it binds to the running loop).
+    """
+    def __init__(self, channel='can0', bustype='socketcan'):
+        self.channel = channel
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.dispatch = DispatchTable()
+        self._waiters = {}   # expected reply ID -> deque of futures (FIFO)
+
+        log.info("🔧 Opening CAN bus '%s' using %s (asyncio) …", channel, bustype)
+        self.bus = can.interface.Bus(channel=channel, bustype=bustype)
+        self.notifier = can.Notifier(self.bus, [self._on_message], loop=self._loop)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    # ----------------------------------------------------------------
+    # Reception
+    # ----------------------------------------------------------------
+    def _on_message(self, msg):
+        # Called in the loop thread on socketcan, in the notifier thread for
+        # buses without a file descriptor (e.g. virtual).
+        if threading.get_ident() == self._loop_thread:
+            self.dispatch.dispatch(msg)
+        else:
+            self._loop.call_soon_threadsafe(self.dispatch.dispatch, msg)
+
+    def subscribe(self, ids=None, maxsize=1000, policy=DROP_OLDEST):
+        """Create a subscription to `ids` (all frames if None)"""
+        sub = Subscription(ids, maxsize, policy)
+        if ids is None:
+            self.dispatch.add(sub.offer)
+        else:
+            for can_id in ids:
+                self.dispatch.add(sub.offer, can_id)
+        self._apply_filters()
+        return sub
+
+    def unsubscribe(self, sub):
+        self.dispatch.remove(sub.offer)
+        self._apply_filters()
+
+    async def frames(self, ids=None, maxsize=1000, policy=DROP_OLDEST):
+        """Async iterator over the received frames of `ids`"""
+        sub = self.subscribe(ids, maxsize, policy)
+        try:
+            while True:
+                yield await sub.queue.get()
+        finally:
+            self.unsubscribe(sub)
+
+    def _apply_filters(self):
+        try:
+            self.bus.set_filters(self.dispatch.filters())
+        except Exception as e:
+            log.warning("⚠️ Could not set CAN filters: %s", e)
+
+    # ----------------------------------------------------------------
+    # Transmission
+    # ----------------------------------------------------------------
+    def send(self, can_id, data=()):
+        msg = can.Message(arbitration_id=can_id, data=bytearray(data), is_extended_id=False)
+        self.bus.send(msg)
+
+    async def request(self, can_id, data=(), *, expect, timeout=0.1):
+        """Send a frame and wait for the next frame with ID `expect`.
+
+        Concurrent requests expecting the same ID are answered in order; the
+        reply ID is only subscribed while a request is waiting for it.
+        Raises asyncio.TimeoutError if no reply arrives within `timeout` s.
+        """
+        waiters = self._waiters.get(expect)
+        if waiters is None:
+            waiters = self._waiters[expect] = deque()
+            self.dispatch.add(self._on_reply, expect)
+            self._apply_filters()
+
+        future = self._loop.create_future()
+        waiters.append(future)
+        try:
+            self.send(can_id, data)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if not future.done():
+                future.cancel()
+            try:
+                waiters.remove(future)
+            except ValueError:
+                pass
+            if not waiters and self._waiters.get(expect) is waiters:
+                del self._waiters[expect]
+                self.dispatch.remove(self._on_reply, expect)
+                self._apply_filters()
+
+    def _on_reply(self, msg):
+        waiters = self._waiters.get(msg.arbitration_id)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(msg)
+                return
+
+    def close(self):
+        self.notifier.stop()
+        self.bus.shutdown()
+        log.info("🛑 CAN bus closed cleanly.")
+
+
+# ================================================================
+# Example: poll the MPU and the anemometer concurrently
+# ================================================================
+async def _demo(channel, bustype, speed):
+    from can_signals import decode
+
+    async with AsyncCANInterface(channel, bustype) as iface:
+        async def poll(request_id, payload, reply_id):
+            while True:
+                try:
+                    reply = await iface.request(request_id, payload, expect=reply_id, timeout=0.05)
+                    log.info("0x%X -> %s", request_id, decode(reply),
+                             extra={"category": ("reply", reply_id)})
+                except asyncio.TimeoutError:
+                    log.warning("⚠️ No reply to 0x%X", request_id, extra={"category": ("timeout", request_id)})
+                await asyncio.sleep(0.01)
+
+        # the anemometer request carries the motor speed
+        await asyncio.gather(poll(0x02, [1], 0x08), poll(0x03, [speed], 0x09))
+
+
+if __name__ == '__main__':
+    import argparse
+    from bus_logging import setup_logging
+
+    parser = argparse.ArgumentParser(description="asyncio CAN polling example")
+    parser.add_argument("--channel", default="can0")
+    parser.add_argument("--bustype", default="socketcan")
+    parser.add_argument("--speed", type=int, default=0, help="motor speed sent to 0x03")
+    args = parser.parse_args()
+    setup_logging(logging.INFO)
+    try:
+        asyncio.run(_demo(args.channel, args.bustype, args.speed))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,189 @@
+# benchmark.py
+"""Throughput benchmark of the CAN receive pipeline.
+
+Synthetic MPU (0x08) and anemometer (0x09) replies are sent at a fixed rate
+on a python-can `virtual` bus (or on `vcan0` with --bustype socketcan), and
+CANInterface alone, or the whole MainIHM dashboard running offscreen (--gui),
+receives them. With --gui the MPU and anemometer views take turns on
+screen and the renders they actually performed are reported. Results are
+printed as JSON, one entry per rate:
+
+    python benchmark.py --rates 1000 5000 20000 --duration 5 --gui -o bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import struct
+import threading
+import time
+
+import can
+
+from bus_logging import setup_logging
+from can_interface import CANInterface
+from latency_stats import LatencyHistogram
+
+MPU_REPLY_ID = 0x08
+WIND_REPLY_ID = 0x09
+
+
+class Generator:
+    """Send alternating 0x08/0x09 frames at `rate` frames per second"""
+    def __init__(self, channel, bustype, rate):
+        self.bus = can.interface.Bus(channel=channel, bustype=bustype)
+        self.rate = rate
+        self.sent = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        frames = []
+        for i in range(360):
+            angles = struct.pack(">hhh", i - 180, (i * 7) % 360 - 180, (i * 13) % 360 - 180)
+            frames.append(can.Message(arbitration_id=MPU_REPLY_ID, data=angles, is_extended_id=False))
+            frames.append(can.Message(arbitration_id=WIND_REPLY_ID, data=[i % 256], is_extended_id=False))
+
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            # send every frame due by now, then sleep ~1 ms
+            due = int((time.perf_counter() - start) * self.rate)
+            while self.sent < due:
+                try:
+                    self.bus.send(frames[self.sent % len(frames)])
+                except can.CanError:
+                    self.errors += 1
+                self.sent += 1
+            time.sleep(0.001)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+        self.bus.shutdown()
+
+
+class ReceiveProbe:
+    """CANInterface callback measuring what reaches the callbacks"""
+    def __init__(self):
+        self.received = 0
+        self.latency = LatencyHistogram()
+        self.cpu_start = None
+        self.cpu_end = None
+
+    def on_frame(self, msg):
+        # runs in the reader thread: thread_time() is its own CPU time
+        cpu = time.thread_time()
+        if self.cpu_start is None:
+            self.cpu_start = cpu
+        self.cpu_end = cpu
+        self.received += 1
+        self.latency.add(time.time() - msg.timestamp)
+
+
+def run_rate(rate, duration, channel, bustype, gui):
+    win = app = None
+    if gui:
+        from PyQt5.QtCore import QTimer
+        from PyQt5.QtWidgets import QApplication
+        from main_ihm import MainIHM
+        app = QApplication.instance() or QApplication([])
+        iface = CANInterface(channel, bustype)
+        win = MainIHM(iface=iface)
+        win.show()
+        # create both views, then show them in turn: hidden views never render
+        views = {"mpu": 0x02, "anemo": 0x03}
+        for sensor_id in views.values():
+            win.activate_sensor(sensor_id)
+        switch = QTimer()
+        switch.timeout.connect(lambda: win.activate_sensor(
+            views["mpu"] if win.active_sensor_id == views["anemo"] else views["anemo"]))
+        switch.start(500)
+        ticks0 = win.refresh.ticks
+    else:
+        iface = CANInterface(channel, bustype)
+
+    probe = ReceiveProbe()
+    iface.add_callback(probe.on_frame, can_id=MPU_REPLY_ID)
+    iface.add_callback(probe.on_frame, can_id=WIND_REPLY_ID)
+
+    generator = Generator(channel, bustype, rate)
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    generator.start()
+    if gui:
+        QTimer.singleShot(int(duration * 1000), app.quit)
+        app.exec_()
+    else:
+        time.sleep(duration)
+    generator.stop()
+    elapsed = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+
+    # let the reader catch up before counting losses
+    deadline = time.perf_counter() + 2.0
+    while probe.received < generator.sent and time.perf_counter() < deadline:
+        if gui:
+            app.processEvents()
+        time.sleep(0.01)
+
+    result = {
+        "rate": rate,
+        "duration_s": elapsed,
+        "sent": generator.sent,
+        "send_errors": generator.errors,
+        "received": probe.received,
+        "dropped": generator.sent - probe.received,
+        "rx_fps": probe.received / elapsed,
+        "callback_latency_s": probe.latency.snapshot(),
+        "reader_cpu_per_frame_us": ((probe.cpu_end - probe.cpu_start) / probe.received * 1e6
+                                    if probe.received > 1 else None),
+        "process_cpu_per_frame_us": cpu / max(probe.received, 1) * 1e6,
+    }
+    if gui:
+        switch.stop()
+        renders = {b.widget: b.renders for b in win.refresh.bindings}
+        result["view_renders_per_s"] = {key: renders.get(win.views.get(key), 0) / elapsed for key in views}
+        result["refresh_ticks_per_s"] = (win.refresh.ticks - ticks0) / elapsed
+        result["bridge"] = {"received": win.bridge.received, "delivered": win.bridge.delivered,
+                            "dropped": win.bridge.dropped}
+        win.close()
+    else:
+        iface.close()
+    return result
+
+
+# ================================================================
+# Entry point
+# ================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="CAN pipeline throughput benchmark")
+    parser.add_argument("--rates", type=int, nargs="+", default=[1000, 5000, 20000],
+                        help="frames per second to generate")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per rate")
+    parser.add_argument("--channel", default="bench")
+    parser.add_argument("--bustype", default="virtual", help="virtual, or socketcan with --channel vcan0")
+    parser.add_argument("--gui", action="store_true", help="run MainIHM offscreen as the receiver")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    if args.gui:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    setup_logging(logging.WARNING)   # no per-frame logging while measuring
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "bustype": args.bustype,
+        "gui": args.gui,
+        "results": [run_rate(rate, args.duration, args.channel, args.bustype, args.gui)
+                    for rate in args.rates],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,154 @@
+# bus_logging.py
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_listener = None
+_handler = None
+_flusher = None
+
+
+def category_name(category):
+    """Printable form of a rate-limit category, e.g. ('rx', 8) -> 'rx 0x8'"""
+    if isinstance(category, tuple) and len(category) == 2 and isinstance(category[1], int):
+        return f"{category[0]} 0x{category[1]:X}"
+    return str(category)
+
+
+class RateLimitedQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks and rate-limits per category.
+
+    Records logged with `extra={"category": ...}` share a budget of `burst`
+    records per `interval` seconds; the others are counted and reported by a
+    single summary record when the window closes
+    ("1000 × rx 0x8 in last 1 s (995 not shown)").
+    Records without a category are never limited. If the queue is full the
+    record is dropped (see `dropped`) instead of stalling the caller.
+    `flush_expired()` summarises windows that closed without a later record
+    of their category (a burst that stopped); setup_logging() calls it
+    from a timer thread.
+    """
+    def __init__(self, log_queue, interval=1.0, burst=5):
+        super().__init__(log_queue)
+        self.interval = interval
+        self.burst = burst
+        self.dropped = 0
+        self._windows = {}   # category -> [window start, count, logger name, level]
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        category = getattr(record, "category", None)
+        if category is not None and not self._admit(category, record):
+            return
+        self.enqueue(record)
+
+    def prepare(self, record):
+        # Same process: formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _admit(self, category, record):
+        now = record.created
+        with self._lock:
+            window = self._windows.get(category)
+            if window is None or now - window[0] >= self.interval:
+                if window is not None:
+                    self._summarise(category, window, now)
+                self._windows[category] = [now, 1, record.name, record.levelno]
+                return True
+            window[1] += 1
+            return window[1] <= self.burst
+
+    def _summarise(self, category, window, now):
+        start, count, name, level = window
+        if count <= self.burst:
+            return
+        summary = logging.LogRecord(
+            name, level, __file__, 0,
+            "%d × %s in last %.3g s (%d not shown)",
+            (count, category_name(category), now - start, count - self.burst), None,
+        )
+        self.enqueue(summary)
+
+    def flush_expired(self, now=None):
+        """Report and close the windows older than `interval`"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [c for c, w in self._windows.items() if now - w[0] >= self.interval]
+            for category in expired:
+                self._summarise(category, self._windows.pop(category), now)
+
+    def flush_summaries(self, now=None):
+        """Report every open window that suppressed records"""
+        now = time.time() if now is None else now
+        with self._lock:
+            windows, self._windows = self._windows, {}
+            for category, window in windows.items():
+                self._summarise(category, window, now)
+
+
+class _SummaryFlusher(threading.Thread):
+    """Call handler.flush_expired() every `interval` seconds"""
+    def __init__(self, handler):
+        super().__init__(name="log-summaries", daemon=True)
+        self.handler = handler
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.handler.interval):
+            self.handler.flush_expired()
+
+    def stop(self):
+        self._done.set()
+        self.join(timeout=1.0)
+
+
+def setup_logging(level=logging.INFO, interval=1.0, burst=5, queue_size=10000, stream=None):
+    """Route all logging through a background thread.
+
+    The calling threads only put records on a bounded queue; a
+    QueueListener thread formats them and writes to `stream` (stderr by
+    default). Safe to call more than once, later calls only change the level.
+    """
+    global _listener, _handler, _flusher
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _handler
+
+    console = logging.StreamHandler(stream or sys.stderr)
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    _handler = RateLimitedQueueHandler(queue.Queue(queue_size), interval, burst)
+    _listener = logging.handlers.QueueListener(_handler.queue, console)
+    _listener.start()
+    root.addHandler(_handler)
+    _flusher = _SummaryFlusher(_handler)
+    _flusher.start()
+    atexit.register(shutdown_logging)
+    return _handler
+
+
+def shutdown_logging():
+    """Flush pending summaries and stop the background thread"""
+    global _listener, _handler, _flusher
+    if _listener is None:
+        return
+    _flusher.stop()
+    _flusher = None
+    _handler.flush_summaries()
+    _listener.stop()
+    logging.getLogger().removeHandler(_handler)
+    _listener = None
+    _handler = None
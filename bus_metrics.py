@@ -0,0 +1,256 @@
+# bus_metrics.py
+"""Bus health counters of a CANInterface, and a Prometheus endpoint.
+
+`BusMetrics.on_frame()` runs on the reader thread for every frame and only
+increments a few integers; rates, bus load and percentiles are computed by a
+sampler thread once per `interval`, or when metrics are scraped.
+
+Counters only see the frames that reach the socket: with kernel filters
+(CANInterface.add_callback(can_id=…)) unsubscribed IDs are not counted and
+the bus load is a lower bound. Kernel-side drops (RX overruns, TX queue full)
+are read from /sys/class/net/<channel>/statistics.
+
+    python main_ihm.py --metrics-port 9108
+    curl localhost:9108/metrics
+"""
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from latency_stats import LatencyHistogram
+from poll_scheduler import frame_bits
+
+log = logging.getLogger(__name__)
+
+# Kernel interface counters exported when the channel is a network device
+NETDEV_COUNTERS = ("rx_errors", "rx_dropped", "rx_over_errors", "rx_fifo_errors",
+                   "tx_errors", "tx_dropped", "tx_fifo_errors")
+
+
+class BusMetrics:
+    def __init__(self, channel, bitrate=500_000, tx_stats=None, interval=1.0, data_bitrate=None):
+        self.channel = channel
+        self.bitrate = bitrate            # set by the application, not known to python-can
+        self.data_bitrate = data_bitrate or bitrate   # CAN FD data phase
+        self._bits = {}                   # (dlc, extended, fd) -> bits, see frame_bits()
+        self.tx_stats = tx_stats          # callable returning TxQueue.stats()
+        self.interval = interval
+        self.started = time.time()
+        self.ids = {}                     # (arbitration ID, is_rx) -> [frames, bytes, bits]
+        self.error_frames = 0
+        self.loop_time = LatencyHistogram()   # reader thread time per frame (dispatch)
+        self.latest = {}                  # last periodic snapshot
+        self._previous = None             # (time, totals) of the previous sample
+        self._callbacks = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_bitrate(self, bitrate, data_bitrate=None):
+        """Bitrates used for the bus load (configured in Linux, unknown to python-can)"""
+        self.bitrate = bitrate
+        self.data_bitrate = data_bitrate or bitrate
+        self._bits = {}
+
+    # ----------------------------------------------------------------
+    # Reader thread
+    # ----------------------------------------------------------------
+    def on_frame(self, msg, loop_time):
+        counters = self.ids.get((msg.arbitration_id, msg.is_rx))
+        if counters is None:
+            counters = self.ids[(msg.arbitration_id, msg.is_rx)] = [0, 0, 0]
+        dlc = msg.dlc
+        counters[0] += 1
+        counters[1] += dlc
+        key = (dlc, msg.is_extended_id, msg.is_fd)
+        bits = self._bits.get(key)
+        if bits is None:
+            bits = self._bits[key] = frame_bits(min(dlc, 64 if msg.is_fd else 8), msg.is_extended_id,
+                                                msg.is_fd, self.data_bitrate / self.bitrate)
+        counters[2] += bits
+        if msg.is_error_frame:
+            self.error_frames += 1
+        self.loop_time.add(loop_time)
+
+    # ----------------------------------------------------------------
+    # Snapshots
+    # ----------------------------------------------------------------
+    def netdev_counters(self):
+        """Kernel statistics of the interface ({} if not a network device)"""
+        path = f"/sys/class/net/{self.channel}/statistics"
+        counters = {}
+        for name in NETDEV_COUNTERS:
+            try:
+                with open(os.path.join(path, name)) as f:
+                    counters[name] = int(f.read())
+            except (OSError, ValueError):
+                pass
+        return counters
+
+    def totals(self):
+        """Cumulative counters (cheap, no rates)"""
+        ids = {key: tuple(c) for key, c in list(self.ids.items())}
+        return {
+            "frames": sum(c[0] for c in ids.values()),
+            "bytes": sum(c[1] for c in ids.values()),
+            "bits": sum(c[2] for c in ids.values()),
+            "error_frames": self.error_frames,
+            "ids": ids,
+        }
+
+    def sample(self):
+        """Take a snapshot with rates since the previous sample"""
+        now = time.time()
+        totals = self.totals()
+        previous_time, previous = self._previous or (self.started, None)
+        elapsed = max(now - previous_time, 1e-9)
+
+        def rate(value, old):
+            return (value - old) / elapsed
+
+        ids = {}
+        for (can_id, is_rx), (frames, nbytes, _) in totals["ids"].items():
+            old = previous["ids"].get((can_id, is_rx), (0, 0, 0)) if previous else (0, 0, 0)
+            ids[f"0x{can_id:X} {'rx' if is_rx else 'tx'}"] = {
+                "frames": frames,
+                "frames_per_s": rate(frames, old[0]),
+                "bytes_per_s": rate(nbytes, old[1]),
+            }
+        old = previous or {"frames": 0, "bytes": 0, "bits": 0, "error_frames": 0}
+        snapshot = {
+            "channel": self.channel,
+            "time": now,
+            "interval": elapsed,
+            "frames": totals["frames"],
+            "error_frames": totals["error_frames"],
+            "frames_per_s": rate(totals["frames"], old["frames"]),
+            "bytes_per_s": rate(totals["bytes"], old["bytes"]),
+            "error_frames_per_s": rate(totals["error_frames"], old["error_frames"]),
+            "bus_load": rate(totals["bits"], old["bits"]) / self.bitrate,
+            "ids": ids,
+            "loop_time": self.loop_time.snapshot(),
+            "netdev": self.netdev_counters(),
+            "tx": self.tx_stats() if self.tx_stats else {},
+        }
+        self._previous = (now, totals)
+        self.latest = snapshot
+        return snapshot
+
+    # ----------------------------------------------------------------
+    # Periodic snapshot API
+    # ----------------------------------------------------------------
+    def subscribe(self, callback):
+        """Call `callback(snapshot)` after every periodic sample (sampler thread)"""
+        self._callbacks.append(callback)
+        self.start()
+
+    def unsubscribe(self, callback):
+        self._callbacks = [cb for cb in self._callbacks if cb != callback]
+
+    def start(self):
+        """Sample every `interval` seconds in the background (idempotent)"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            snapshot = self.sample()
+            for callback in self._callbacks:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    log.warning("⚠️ Metrics callback failed: %s", e)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+# ================================================================
+# Prometheus text exposition
+# ================================================================
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text(metrics_list):
+    """Render BusMetrics objects in the Prometheus text format (0.0.4)"""
+    families = {}    # name -> (type, help, [(labels, value)])
+
+    def add(name, kind, help_text, labels, value):
+        if value is None:
+            return
+        families.setdefault(name, (kind, help_text, []))[2].append((labels, value))
+
+    for m in metrics_list:
+        ch = {"channel": m.channel}
+        totals = m.totals()
+        latest = m.latest
+        for (can_id, is_rx), (frames, nbytes, _) in sorted(totals["ids"].items()):
+            labels = dict(ch, id=f"0x{can_id:X}", direction="rx" if is_rx else "tx")
+            add("buscan_frames_total", "counter", "Frames seen by the reader thread", labels, frames)
+            add("buscan_bytes_total", "counter", "Payload bytes seen by the reader thread", labels, nbytes)
+        add("buscan_error_frames_total", "counter", "CAN error frames", ch, totals["error_frames"])
+        add("buscan_bus_load_ratio", "gauge", "Estimated bus load over the last sampling interval",
+            ch, latest.get("bus_load"))
+        add("buscan_frames_per_second", "gauge", "Frame rate over the last sampling interval",
+            ch, latest.get("frames_per_s"))
+        add("buscan_bitrate_bits_per_second", "gauge", "Nominal bitrate used for the load", ch, m.bitrate)
+
+        loop = m.loop_time
+        for q in (0.5, 0.95, 0.99):
+            add("buscan_reader_loop_seconds", "summary", "Reader thread time per frame",
+                dict(ch, quantile=str(q)), loop.percentile(q * 100))
+        add("buscan_reader_loop_seconds_sum", "", "", ch, loop.total)
+        add("buscan_reader_loop_seconds_count", "", "", ch, loop.count)
+
+        for name, value in m.netdev_counters().items():
+            add(f"buscan_netdev_{name}_total", "counter", f"Kernel interface counter {name}", ch, value)
+        if m.tx_stats:
+            tx = m.tx_stats()
+            for key in ("sent", "coalesced", "dropped", "retries", "errors"):
+                if key in tx:
+                    add(f"buscan_tx_{key}_total", "counter", f"Transmit queue: {key}", ch, tx[key])
+            if "queued" in tx:
+                add("buscan_tx_queued", "gauge", "Frames waiting in the transmit queue", ch, tx["queued"])
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        if kind:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics_list, port=9108, host="127.0.0.1"):
+    """Serve /metrics on a background thread; returns the HTTP server (call .shutdown())"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(metrics_list).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            log.debug("metrics: " + fmt, *args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for m in metrics_list:
+        m.start()
+    log.info("📊 Metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,231 @@
+# bus_recorder.py
+"""Record CAN traffic into a fixed-record ring file and replay it.
+
+File layout (little endian):
+    header  64 bytes   magic, version, data size, record size, capacity,
+                       number of frames written, creation time
+    records capacity x record size
+            timestamp f64 | arbitration ID u32 | DLC u8 | flags u8 | 2 pad | data
+
+The file is pre-allocated and memory-mapped, recording a frame is a single
+`struct.pack_into`. Once `capacity` frames are written the oldest ones are
+overwritten (ring), the header counter tells where the oldest frame is.
+"""
+import argparse
+import logging
+import mmap
+import struct
+import threading
+import time
+
+import can
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"BUSCANR1"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIQQd")
+HEADER_SIZE = 64
+COUNT_OFFSET = 8 + 2 + 2 + 4 + 8   # offset of the "frames written" counter
+
+FLAG_EXTENDED = 0x01
+FLAG_ERROR = 0x02
+FLAG_REMOTE = 0x04
+FLAG_FD = 0x08
+FLAG_BRS = 0x10
+FLAG_TX = 0x20        # sent by this host (looped back, is_rx == False)
+
+
+def record_struct(data_size=8):
+    """Struct of one record for a given payload size (8 classic, 64 CAN FD)"""
+    return struct.Struct(f"<dIBB2x{data_size}s")
+
+
+def record_dtype(data_size=8):
+    """NumPy dtype with the same layout as `record_struct()`"""
+    import numpy as np
+    return np.dtype({
+        "names": ["timestamp", "can_id", "dlc", "flags", "data"],
+        "formats": ["<f8", "<u4", "u1", "u1", ("u1", data_size)],
+        "offsets": [0, 8, 12, 13, 16],
+        "itemsize": 16 + data_size,
+    })
+
+
+class BusRecorder:
+    """Write frames into a memory-mapped, pre-allocated ring file.
+
+    `record()` can be registered as a CANInterface callback; it runs in the
+    receive thread and does no I/O (the kernel writes the pages back).
+    """
+    def __init__(self, path, capacity=1_000_000, data_size=8):
+        self.path = path
+        self.capacity = capacity
+        self.data_size = data_size
+        self.count = 0
+        self._record = record_struct(data_size)
+        self._lock = threading.Lock()
+
+        size = HEADER_SIZE + capacity * self._record.size
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, data_size, self._record.size,
+                         capacity, 0, time.time())
+        log.info("⏺️ Recording to %s (%d frames, %.1f MB)", path, capacity, size / 1e6)
+
+    def record(self, msg):
+        """Append one frame (callback for CANInterface)"""
+        flags = ((FLAG_EXTENDED if msg.is_extended_id else 0)
+                 | (FLAG_ERROR if msg.is_error_frame else 0)
+                 | (FLAG_REMOTE if msg.is_remote_frame else 0)
+                 | (FLAG_FD if msg.is_fd else 0)
+                 | (FLAG_BRS if msg.bitrate_switch else 0)
+                 | (0 if msg.is_rx else FLAG_TX))
+        with self._lock:
+            if self._map is None:
+                return
+            slot = self.count % self.capacity
+            self._record.pack_into(
+                self._map, HEADER_SIZE + slot * self._record.size,
+                msg.timestamp, msg.arbitration_id, msg.dlc, flags,
+                bytes(msg.data[:self.data_size]),
+            )
+            self.count += 1
+            struct.pack_into("<Q", self._map, COUNT_OFFSET, self.count)
+
+    def close(self):
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        self._file.close()
+        log.info("⏹️ Recorded %d frames to %s", self.count, self.path)
+
+
+# ----------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------
+def read_header(path):
+    """Return the header of a recording as a dict"""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+    magic, version, data_size, record_size, capacity, count, created = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a bus recording")
+    return {
+        "version": version, "data_size": data_size, "record_size": record_size,
+        "capacity": capacity, "count": count, "created": created,
+        "first": max(0, count - capacity),   # index of the oldest frame still stored
+        "stored": min(count, capacity),
+    }
+
+
+def iter_frames(path):
+    """Yield the recorded frames as can.Message, oldest first"""
+    header = read_header(path)
+    record = record_struct(header["data_size"])
+    capacity = header["capacity"]
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        for index in range(header["first"], header["count"]):
+            offset = HEADER_SIZE + (index % capacity) * record.size
+            timestamp, can_id, dlc, flags, data = record.unpack_from(m, offset)
+            is_fd = bool(flags & FLAG_FD)
+            yield can.Message(
+                timestamp=timestamp, arbitration_id=can_id,
+                is_extended_id=bool(flags & FLAG_EXTENDED),
+                is_error_frame=bool(flags & FLAG_ERROR),
+                is_remote_frame=bool(flags & FLAG_REMOTE),
+                is_fd=is_fd, bitrate_switch=bool(flags & FLAG_BRS),
+                is_rx=not flags & FLAG_TX,
+                dlc=dlc, data=data[:dlc],
+            )
+
+
+class BusReplayer:
+    """Feed a recording back in its original timing.
+
+    `target` is either a CANInterface (frames go through its callbacks, as if
+    received) or any python-can bus (frames are sent, e.g. on a `virtual`
+    bus or on `vcan0`). `speed` scales time: 1.0 real time, 10.0 ten times
+    faster, 0 or None as fast as possible.
+    """
+    def __init__(self, path, target, speed=1.0):
+        self.path = path
+        self.target = target
+        self.speed = speed
+        self.replayed = 0
+        self._stop = threading.Event()
+        self.thread = None
+
+        if hasattr(target, "inject"):
+            self._emit = target.inject
+        else:
+            self._emit = target.send
+
+    def run(self):
+        """Replay in the calling thread, returns the number of frames"""
+        start = None
+        for msg in iter_frames(self.path):
+            if self._stop.is_set():
+                break
+            if self.speed:
+                if start is None:
+                    start = (msg.timestamp, time.perf_counter())
+                due = start[1] + (msg.timestamp - start[0]) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self._emit(msg)
+            self.replayed += 1
+        log.info("▶️ Replayed %d frames from %s", self.replayed, self.path)
+        return self.replayed
+
+    def start(self):
+        """Replay in a background thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self):
+        self._stop.set()
+
+
+# ================================================================
+# Command line: record a channel / replay onto a channel
+# ================================================================
+if __name__ == '__main__':
+    from bus_logging import setup_logging
+    from can_interface import CANInterface
+
+    parser = argparse.ArgumentParser(description="Record or replay CAN traffic")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="record a channel until Ctrl-C")
+    rec.add_argument("path")
+    rec.add_argument("--capacity", type=int, default=1_000_000)
+    rep = sub.add_parser("replay", help="send a recording onto a channel")
+    rep.add_argument("path")
+    rep.add_argument("--speed", type=float, default=1.0, help="0 = as fast as possible")
+    for p in (rec, rep):
+        p.add_argument("--channel", default="can0")
+        p.add_argument("--bustype", default="socketcan")
+    args = parser.parse_args()
+    setup_logging(logging.INFO)
+
+    if args.command == "record":
+        iface = CANInterface(args.channel, bustype=args.bustype)
+        iface.start_recording(args.path, args.capacity)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        iface.close()
+    else:
+        bus = can.interface.Bus(channel=args.channel, bustype=args.bustype)
+        try:
+            BusReplayer(args.path, bus, args.speed).run()
+        finally:
+            bus.shutdown()
@@ -1,69 +1,363 @@
 # can_interface.py
 import can
+import logging
 import threading
 import time
 
+import profiling
+from bus_metrics import BusMetrics
+from latency_stats import RoundTripTracker
+from tx_queue import PRIORITY_NORMAL, TxQueue
+
+log = logging.getLogger(__name__)
+
+STD_ID_MASK = 0x7FF        # 11-bit standard identifiers
+EXT_ID_MASK = 0x1FFFFFFF   # 29-bit extended identifiers
+
+
+class DispatchTable:
+    """Route received frames to callbacks by arbitration ID.
+
+    A callback subscribes either to every frame (`can_id=None`) or to the IDs
+    matching `can_id` under `mask`, like a SocketCAN filter. The handlers of an
+    ID are resolved once and cached, so dispatching a frame is a single dict
+    lookup whatever the number of subscriptions.
+
+    While `profiling.timer` is enabled every callback call is timed.
+    """
+    def __init__(self):
+        self._subscriptions = []   # (callback, can_id, mask, extended)
+        self._cache = {}           # arbitration ID -> tuple of callbacks
+        self._lock = threading.Lock()
+
+    def add(self, callback, can_id=None, mask=None):
+        extended = can_id is not None and can_id > STD_ID_MASK
+        if can_id is not None and mask is None:
+            mask = EXT_ID_MASK if extended else STD_ID_MASK
+        with self._lock:
+            self._subscriptions.append((callback, can_id, mask, extended))
+            self._cache = {}
+
+    def remove(self, callback, can_id=None):
+        """Drop the subscriptions of `callback` (only the one to `can_id` if given)"""
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions
+                                   if s[0] != callback or (can_id is not None and s[1] != can_id)]
+            self._cache = {}
+
+    def has_subscriptions(self):
+        return bool(self._subscriptions)
+
+    def handlers(self, arbitration_id):
+        """Return the callbacks subscribed to this ID (cached)"""
+        cache = self._cache
+        try:
+            return cache[arbitration_id]
+        except KeyError:
+            pass
+        with self._lock:
+            # dict.fromkeys: a callback matching several subscriptions runs once
+            found = tuple(dict.fromkeys(
+                cb for cb, can_id, mask, _ in self._subscriptions
+                if can_id is None or (arbitration_id & mask) == (can_id & mask)
+            ))
+            self._cache[arbitration_id] = found
+        return found
+
+    def dispatch(self, msg):
+        timer = profiling.timer
+        if timer.enabled:
+            for cb in self.handlers(msg.arbitration_id):
+                timer.call_callback(cb, msg)
+            return
+        for cb in self.handlers(msg.arbitration_id):
+            cb(msg)
+
+    def filters(self):
+        """Union of the subscribed IDs as python-can filters.
+
+        Returns None (receive everything) as soon as one catch-all callback
+        is registered.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions or any(s[1] is None for s in subscriptions):
+            return None
+        unique = {(can_id, mask, extended) for _, can_id, mask, extended in subscriptions}
+        return [
+            {"can_id": can_id, "can_mask": mask, "extended": extended}
+            for can_id, mask, extended in sorted(unique)
+        ]
+
+
 class CANInterface:
-    def __init__(self, channel='can0'):
-        """Initialize and open the CAN interface"""
+    def __init__(self, channel='can0', bustype='socketcan', fd=False):
+        """Initialize and open the CAN interface.
+
+        With `fd` the socket accepts CAN FD frames (up to 64 bytes) and frames
+        are sent as CAN FD with bitrate switching; the data bitrate is
+        configured in Linux (`ip link set can0 type can … dbitrate … fd on`).
+        """
         self.channel = channel
+        self.bustype = bustype
+        self.fd = fd
         self.bus = None
-        self.callbacks = []
+        self.tx = None
+        self.recorder = None
+        self.exporter = None
+        self.raw = None
+        self.latency = RoundTripTracker()
+        self.dispatch = DispatchTable()
+        self.metrics = BusMetrics(channel, tx_stats=self.tx_stats)
+        self.periodic_tasks = {}   # CAN ID -> python-can cyclic send task
         self.running = False
 
         try:
-            print(f"🔧 Opening CAN bus '{channel}' using socketcan …")
-            # socketcan: the bitrate is configured in Linux, no need to pass it
-            self.bus = can.interface.Bus(channel=channel, bustype='socketcan')
-            print("✅ CAN interface opened successfully!")
+            log.info("🔧 Opening CAN bus '%s' using %s …", channel, bustype)
+            # socketcan: the bitrate is configured in Linux, no need to pass it.
+            # Our own frames are looped back (is_rx=False) so that requests can
+            # be timestamped; the filters keep them out unless subscribed.
+            self.bus = can.interface.Bus(channel=channel, bustype=bustype,
+                                         receive_own_messages=True, fd=fd)
+            log.info("✅ CAN interface opened successfully!")
         except Exception as e:
-            print(f"❌ CAN init error: {e}")
+            log.error("❌ CAN init error: %s", e)
             return
 
-        # Start background receive thread
+        # Transmit thread (send_message) and background receive thread
+        self.tx = TxQueue(self.bus, fd=fd)
         self.running = True
         self.thread = threading.Thread(target=self._read_loop, daemon=True)
         self.thread.start()
 
     def _read_loop(self):
         """Continuously read messages from CAN bus"""
+        metrics = self.metrics
         while self.running and self.bus:
             try:
                 msg = self.bus.recv(timeout=0.1)
                 if msg:
-                    print(f"📩 Received frame: ID=0x{msg.arbitration_id:X}, Data={list(msg.data)}")
-                    for cb in self.callbacks:
-                        cb(msg)
+                    start = time.perf_counter()
+                    # per-frame logging is DEBUG only: at INFO nothing is built here
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("📩 Received frame: ID=0x%X, Data=%s", msg.arbitration_id, list(msg.data),
+                                 extra={"category": ("rx" if msg.is_rx else "tx echo", msg.arbitration_id)})
+                    self.dispatch.dispatch(msg)
+                    metrics.on_frame(msg, time.perf_counter() - start)
             except can.CanError as e:
-                print(f"⚠️ CAN read error: {e}")
+                log.warning("⚠️ CAN read error: %s", e, extra={"category": "rx error"})
                 time.sleep(0.1)
 
-    def send_message(self, can_id, data):
-        """Send a CAN message with the given ID and data"""
+    def inject(self, msg):
+        """Deliver a frame to the callbacks as if it had been received"""
+        self.dispatch.dispatch(msg)
+
+    def send_message(self, can_id, data, priority=PRIORITY_NORMAL, coalesce=True):
+        """Queue a CAN message for the transmit thread, without blocking.
+
+        With `coalesce` a frame still waiting for the same ID is replaced
+        (latest wins); `priority=tx_queue.PRIORITY_HIGH` frames go first.
+        Returns False if the frame was dropped, see tx_stats().
+        """
+        if not self.tx:
+            log.error("❌ CAN bus not initialized!", extra={"category": "tx error"})
+            return False
+        return self.tx.put(can_id, data, priority, coalesce)
+
+    def send_now(self, can_id, data):
+        """Send a frame from the calling thread, bypassing the transmit queue.
+
+        For latency-critical frames sent from a receive callback (see
+        motor_control). No retry: returns False if the frame could not leave
+        at once (e.g. ENOBUFS), the caller then falls back to send_message().
+        """
         if not self.bus:
-            print("❌ CAN bus not initialized!")
-            return
+            return False
         try:
-            msg = can.Message(arbitration_id=can_id, data=bytearray(data), is_extended_id=False)
-            self.bus.send(msg)
-            print(f"✅ Sent CAN frame ID=0x{can_id:X}, Data={list(data)}")
-        except can.CanError as e:
-            print(f"❌ CAN send error: {e}")
+            self.bus.send(self._message(can_id, data), timeout=0)
         except Exception as e:
-            print(f"❌ General CAN send error: {e}")
+            log.warning("⚠️ Direct send of ID=0x%X failed, queued instead: %s", can_id, e,
+                        extra={"category": "tx error"})
+            return False
+        return True
+
+    def tx_stats(self):
+        """Counters of the transmit queue (sent, coalesced, dropped …)"""
+        return self.tx.stats() if self.tx else {}
+
+    def _message(self, can_id, data):
+        return can.Message(arbitration_id=can_id, data=bytearray(data), is_extended_id=False,
+                           is_fd=self.fd, bitrate_switch=self.fd)
 
-    def add_callback(self, callback):
-        """Register a callback for received messages"""
+    # ----------------------------------------------------------------
+    # Periodic requests (SocketCAN broadcast manager)
+    # ----------------------------------------------------------------
+    def start_periodic(self, can_id, data, period=0.01):
+        """Let the kernel send a frame every `period` seconds.
+
+        On socketcan the task is handled by the broadcast manager (BCM), so no
+        Python code runs per period. Any task already running for this ID is
+        replaced.
+        """
+        if not self.bus:
+            log.error("❌ CAN bus not initialized!")
+            return None
+        self.stop_periodic(can_id)
+        msg = self._message(can_id, data)
+        try:
+            task = self.bus.send_periodic(msg, period)
+        except Exception as e:
+            log.error("❌ Could not start periodic frame ID=0x%X: %s", can_id, e)
+            return None
+        self.periodic_tasks[can_id] = task
+        log.info("🔁 Periodic frame ID=0x%X every %g ms, Data=%s", can_id, period * 1000, list(data))
+        return task
+
+    def update_periodic(self, can_id, data):
+        """Atomically replace the payload of a running periodic frame"""
+        task = self.periodic_tasks.get(can_id)
+        if task is None:
+            return False
+        msg = self._message(can_id, data)
+        try:
+            task.modify_data(msg)
+        except Exception as e:
+            log.error("❌ Could not update periodic frame ID=0x%X: %s", can_id, e)
+            return False
+        return True
+
+    def stop_periodic(self, can_id=None):
+        """Stop the periodic frame of `can_id`, or all of them"""
+        ids = list(self.periodic_tasks) if can_id is None else [can_id]
+        for i in ids:
+            task = self.periodic_tasks.pop(i, None)
+            if task is None:
+                continue
+            try:
+                task.stop()
+            except Exception as e:
+                log.warning("⚠️ Error while stopping periodic frame ID=0x%X: %s", i, e)
+
+    # ----------------------------------------------------------------
+    # Callbacks
+    # ----------------------------------------------------------------
+    def add_callback(self, callback, can_id=None, mask=None):
+        """Register a callback for received messages.
+
+        Without `can_id` the callback receives every frame. With `can_id`
+        (and optionally `mask`) it only receives matching frames, and the
+        socket filters are reprogrammed so that frames nobody subscribed to
+        are dropped by the kernel.
+        """
         if callable(callback):
-            self.callbacks.append(callback)
+            self.dispatch.add(callback, can_id, mask)
+            self._apply_filters()
+
+    def remove_callback(self, callback):
+        """Unregister a callback (every subscription it holds)"""
+        self.dispatch.remove(callback)
+        self._apply_filters()
+
+    def _apply_filters(self):
+        """Program the union of the subscribed IDs into the socket filters"""
+        if not self.bus:
+            return
+        try:
+            self.bus.set_filters(self.dispatch.filters())
+        except Exception as e:
+            log.warning("⚠️ Could not set CAN filters: %s", e)
+
+    # ----------------------------------------------------------------
+    # Round-trip latency
+    # ----------------------------------------------------------------
+    def track_round_trip(self, request_id, reply_id, period=None):
+        """Measure latency/jitter/loss between `request_id` and `reply_id`.
+
+        Requests are taken from the bus loopback, so frames sent by the kernel
+        (periodic tasks) are timestamped as well as send_message() ones.
+        """
+        self.latency.track(request_id, reply_id, period)
+        self.add_callback(self.latency.on_frame, can_id=request_id)
+        self.add_callback(self.latency.on_frame, can_id=reply_id)
+
+    def latency_stats(self):
+        """Per-sensor statistics, see latency_stats.SensorLatency.snapshot()"""
+        return self.latency.snapshot()
+
+    # ----------------------------------------------------------------
+    # Recording
+    # ----------------------------------------------------------------
+    def start_recording(self, path, capacity=1_000_000):
+        """Record every received frame into a ring file (see bus_recorder)"""
+        from bus_recorder import BusRecorder
+        self.stop_recording()
+        self.recorder = BusRecorder(path, capacity, data_size=64 if self.fd else 8)
+        # catch-all subscription: the whole bus is recorded, not only our IDs
+        self.add_callback(self.recorder.record)
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        self.remove_callback(self.recorder.record)
+        self.recorder.close()
+        self.recorder = None
+
+    # ----------------------------------------------------------------
+    # Columnar export of decoded signals
+    # ----------------------------------------------------------------
+    def start_export(self, directory, **options):
+        """Export the decoded MPU and anemometer signals, see data_export"""
+        from data_export import ColumnarExporter
+        self.stop_export()
+        self.exporter = ColumnarExporter(directory, **options)
+        self.exporter.attach(self)
+        return self.exporter
+
+    def stop_export(self):
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+    # ----------------------------------------------------------------
+    # Raw high-rate capture
+    # ----------------------------------------------------------------
+    def start_raw_capture(self, capacity=1 << 20, batch=512):
+        """Capture the channel into a NumPy ring, see raw_receiver.
+
+        Runs on its own CAN_RAW socket, next to the python-can one, and
+        returns the RawReceiver (its `ring` holds the frames). Classic
+        frames only: CAN FD frames are not captured.
+        """
+        from raw_receiver import RawReceiver
+        self.stop_raw_capture()
+        self.raw = RawReceiver(self.channel, capacity, batch)
+        return self.raw
+
+    def stop_raw_capture(self):
+        if self.raw is not None:
+            self.raw.close()
+            self.raw = None
+
+    def metrics_snapshot(self):
+        """Counters and rates since the previous snapshot, see bus_metrics"""
+        return self.metrics.sample()
 
     def close(self):
         """Close CAN interface cleanly"""
         self.running = False
+        self.metrics.stop()
+        if self.tx:
+            self.tx.close()
+            self.tx = None
+        self.stop_periodic()
+        self.stop_recording()
+        self.stop_export()
+        self.stop_raw_capture()
         if self.bus:
             try:
                 self.bus.shutdown()
-                print("🛑 CAN bus closed cleanly.")
+                log.info("🛑 CAN bus closed cleanly.")
             except Exception as e:
-                print(f"⚠️ Error while closing CAN bus: {e}")
+                log.warning("⚠️ Error while closing CAN bus: %s", e)
             self.bus = None
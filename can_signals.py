@@ -0,0 +1,262 @@
+# can_signals.py
+"""Declarative CAN message definitions and fast decoders.
+
+A MessageDef lists its signals (byte offset, width, signedness, byte order,
+scale/offset). It is compiled once into:
+  * `struct.Struct`s, to decode one frame (`decode`, `decode_values`)
+  * a NumPy structured dtype, to decode thousands of frames at once
+    (`decode_array`), e.g. from a recording.
+
+A CAN FD frame may carry several samples of the same layout packed back to
+back (e.g. 10 roll/pitch/yaw triples in 60 bytes). `decode_samples` decodes
+them in one NumPy pass and dates them from the frame timestamp and the
+message `sample_period`; `latest_values` decodes the newest one only.
+
+The definitions of the messages used by the dashboard are at the bottom of
+this file; others can be loaded from a DBC file with `load_dbc()`.
+"""
+import struct
+
+_INT_CODES = {1: "b", 2: "h", 4: "i", 8: "q"}
+_BYTEORDER_PREFIX = {"big": ">", "little": "<"}
+
+
+class Signal:
+    """One integer field of a frame: value = raw * scale + offset"""
+    def __init__(self, name, start, size=1, signed=False, byteorder='big',
+                 scale=1.0, offset=0.0, unit=''):
+        if size not in _INT_CODES:
+            raise ValueError(f"signal {name}: size must be 1, 2, 4 or 8 bytes")
+        if byteorder not in _BYTEORDER_PREFIX:
+            raise ValueError(f"signal {name}: byteorder must be 'big' or 'little'")
+        self.name = name
+        self.start = start
+        self.size = size
+        self.signed = signed
+        self.byteorder = byteorder
+        self.scale = scale
+        self.offset = offset
+        self.unit = unit
+
+    @property
+    def end(self):
+        return self.start + self.size
+
+    @property
+    def is_raw(self):
+        """True when no scaling is applied"""
+        return self.scale == 1 and self.offset == 0
+
+    def code(self):
+        c = _INT_CODES[self.size]
+        return c if self.signed else c.upper()
+
+    def numpy_format(self):
+        return _BYTEORDER_PREFIX[self.byteorder] + ("i" if self.signed else "u") + str(self.size)
+
+    def __repr__(self):
+        return f"Signal({self.name!r}, start={self.start}, size={self.size})"
+
+
+class MessageDef:
+    """A frame layout, compiled into struct/NumPy decoders.
+
+    `sample_period` (s) is the time between samples packed in one frame; the
+    frame timestamp is the one of the last sample.
+    """
+    def __init__(self, name, can_id, signals, sample_period=None):
+        self.name = name
+        self.can_id = can_id
+        self.signals = list(signals)
+        self.names = tuple(s.name for s in self.signals)
+        self.length = max(s.end for s in self.signals)   # minimum payload size = sample size
+        self.sample_period = sample_period
+        self._compile()
+        self._dtypes = {}   # row width -> NumPy dtype
+
+    def _compile(self):
+        # One Struct per byte order (usually a single one), padded with 'x'
+        # so that each Struct unpacks straight from the start of the payload.
+        self._groups = []
+        for byteorder in ("big", "little"):
+            members = sorted(
+                (i for i, s in enumerate(self.signals) if s.byteorder == byteorder),
+                key=lambda i: self.signals[i].start,
+            )
+            if not members:
+                continue
+            fmt, pos = _BYTEORDER_PREFIX[byteorder], 0
+            for i in members:
+                s = self.signals[i]
+                if s.start < pos:
+                    raise ValueError(f"{self.name}: signal {s.name} overlaps another signal")
+                fmt += "x" * (s.start - pos) + s.code()
+                pos = s.end
+            self._groups.append((struct.Struct(fmt), members))
+
+        self._scaling = [None if s.is_raw else (s.scale, s.offset) for s in self.signals]
+        self._all_raw = all(s.is_raw for s in self.signals)
+        if len(self._groups) == 1 and self._groups[0][1] == list(range(len(self.signals))):
+            self._unpack = self._groups[0][0].unpack_from   # fast path
+        else:
+            self._unpack = None
+
+    # ----------------------------------------------------------------
+    # Single frame
+    # ----------------------------------------------------------------
+    def decode_raw(self, data, offset=0):
+        """Raw integer values, in signal order"""
+        if self._unpack is not None:
+            return self._unpack(data, offset)
+        values = [0] * len(self.signals)
+        for st, members in self._groups:
+            for i, v in zip(members, st.unpack_from(data, offset)):
+                values[i] = v
+        return tuple(values)
+
+    def decode_values(self, data, offset=0):
+        """Scaled values, in signal order"""
+        raw = self.decode_raw(data, offset)
+        if self._all_raw:
+            return raw
+        return tuple(v if k is None else v * k[0] + k[1] for v, k in zip(raw, self._scaling))
+
+    def decode(self, data):
+        """Scaled values as a {signal name: value} dict"""
+        return dict(zip(self.names, self.decode_values(data)))
+
+    # ----------------------------------------------------------------
+    # Several samples packed in one frame (CAN FD)
+    # ----------------------------------------------------------------
+    def n_samples(self, data):
+        return len(data) // self.length
+
+    def latest_values(self, data):
+        """Scaled values of the last (newest) sample of the frame"""
+        return self.decode_values(data, (self.n_samples(data) - 1) * self.length)
+
+    def sample_times(self, timestamp, n):
+        """Timestamps of `n` samples of a frame received at `timestamp`"""
+        import numpy as np
+        if not self.sample_period:
+            return np.full(n, timestamp)
+        return timestamp - self.sample_period * np.arange(n - 1, -1, -1)
+
+    def decode_samples(self, data, timestamp):
+        """Decode every packed sample of one frame.
+
+        Returns (timestamps, {signal name: array}), oldest sample first.
+        """
+        import numpy as np
+        n = self.n_samples(data)
+        payloads = np.frombuffer(data, np.uint8, n * self.length).reshape(n, self.length)
+        return self.sample_times(timestamp, n), self.decode_array(payloads)
+
+    # ----------------------------------------------------------------
+    # Many frames (NumPy)
+    # ----------------------------------------------------------------
+    def dtype(self, row_width=None):
+        """Structured dtype of the payload, `row_width` bytes per frame"""
+        import numpy as np
+        row_width = row_width or self.length
+        dt = self._dtypes.get(row_width)
+        if dt is None:
+            dt = np.dtype({
+                "names": list(self.names),
+                "formats": [s.numpy_format() for s in self.signals],
+                "offsets": [s.start for s in self.signals],
+                "itemsize": row_width,
+            })
+            self._dtypes[row_width] = dt
+        return dt
+
+    def decode_array(self, data):
+        """Decode a (N, width) uint8 array of payloads in one pass.
+
+        Returns {signal name: array}. Raw signals keep their integer type,
+        scaled ones are float64. No copy is made when `data` is C-contiguous.
+        """
+        import numpy as np
+        data = np.ascontiguousarray(data, dtype=np.uint8)
+        if data.ndim != 2 or data.shape[1] < self.length:
+            raise ValueError(f"{self.name}: expected (N, >={self.length}) payloads, got {data.shape}")
+        records = data.view(self.dtype(data.shape[1]))[:, 0]
+        out = {}
+        for s in self.signals:
+            raw = records[s.name]
+            if s.is_raw:
+                out[s.name] = raw.astype(raw.dtype.newbyteorder("="), copy=False)
+            else:
+                out[s.name] = raw * s.scale + s.offset
+        return out
+
+    def __repr__(self):
+        return f"MessageDef({self.name!r}, 0x{self.can_id:X}, {list(self.names)})"
+
+
+# ----------------------------------------------------------------
+# DBC import (optional dependency: cantools)
+# ----------------------------------------------------------------
+def load_dbc(path):
+    """Load the byte-aligned integer signals of a DBC file.
+
+    Returns {CAN ID: MessageDef}. A `SamplePeriod` message attribute (ms)
+    sets the time between packed samples. Needs the `cantools` package.
+    """
+    try:
+        import cantools
+    except ImportError:
+        raise ImportError("load_dbc() needs the 'cantools' package (pip install cantools)")
+
+    messages = {}
+    for m in cantools.database.load_file(path).messages:
+        signals = []
+        for s in m.signals:
+            big = s.byte_order == "big_endian"
+            if s.length % 8 or s.start % 8 != (7 if big else 0) or s.length // 8 not in _INT_CODES:
+                raise ValueError(f"{m.name}.{s.name}: only byte-aligned 8/16/32/64-bit signals are supported")
+            signals.append(Signal(
+                s.name, s.start // 8, s.length // 8, s.is_signed,
+                "big" if big else "little", s.scale, s.offset, s.unit or "",
+            ))
+        period = m.dbc.attributes.get("SamplePeriod") if m.dbc is not None else None
+        messages[m.frame_id] = MessageDef(m.name, m.frame_id, signals,
+                                          period.value / 1000.0 if period is not None else None)
+    return messages
+
+
+# ================================================================
+# Dashboard messages
+# ================================================================
+# Time between the angle triples packed in a CAN FD reply. ASSUMED: the IMU
+# firmware is not in this repository and nothing here measures its rate;
+# every packed-sample timestamp (history, export, analysis) depends on it.
+# Override with --mpu-sample-period, see set_sample_periods().
+MPU_SAMPLE_PERIOD = 0.001
+
+# One triple per classic frame; on CAN FD up to 10 triples (60 bytes)
+MPU_ANGLES = MessageDef("MPU9250 angles", 0x08, [
+    Signal("roll", 0, 2, signed=True, unit="deg"),
+    Signal("pitch", 2, 2, signed=True, unit="deg"),
+    Signal("yaw", 4, 2, signed=True, unit="deg"),
+], sample_period=MPU_SAMPLE_PERIOD)
+
+WIND_SPEED = MessageDef("Anemometer speed", 0x09, [
+    Signal("rpm", 0, 1, unit="RPM"),
+])
+
+MESSAGES = {m.can_id: m for m in (MPU_ANGLES, WIND_SPEED)}
+
+
+def set_sample_periods(periods):
+    """Set the packed-sample period of known messages: {CAN ID: seconds}"""
+    for can_id, seconds in (periods or {}).items():
+        MESSAGES[can_id].sample_period = seconds
+
+
+def decode(msg):
+    """Decode a received frame with the known definitions (None if unknown or too short)"""
+    definition = MESSAGES.get(msg.arbitration_id)
+    if definition is None or len(msg.data) < definition.length:
+        return None
+    return definition.decode(msg.data)
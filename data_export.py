@@ -0,0 +1,280 @@
+# data_export.py
+"""Streaming export of decoded signals to columnar NumPy chunks.
+
+The exporter is fed by CANInterface callbacks: on the reader thread a frame
+is only appended to a pending list (bounded: beyond `max_pending` frames they
+are dropped and counted). A writer thread takes the pending frames every
+`flush_interval`, decodes them per message and payload length in one NumPy
+pass (packed CAN FD samples included, see can_signals) and appends the
+columns to the current chunk.
+
+Layout on disk:
+
+    <directory>/<segment start YYYYmmdd-HHMMSS>-<segment number>/chunk-000001.npz
+                                                                 chunk-000002.npz …
+
+The segment number keeps the name unique in the directory, even for several
+exporters started in the same second. A chunk is written once about
+`chunk_rows` rows are decoded (or `chunk_seconds` after its first row), with
+one "<message name>/<column>" array per signal; column "t" is the
+timestamp. A segment is closed once it holds `max_segment_bytes` or is
+`max_segment_seconds` old, so a multi-hour session is split in segments
+that can be archived or deleted separately.
+
+Chunks are written as ".tmp" files and only renamed once fsynced, every
+`fsync_every` chunks (and when the exporter is closed): a crash loses at
+most the unsynced chunks, never leaves a truncated one behind.
+
+    data = load_export("session/")      # {message name: {column: array}}
+    data["MPU9250 angles"]["roll"]
+"""
+import glob
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from can_signals import MESSAGES
+
+log = logging.getLogger(__name__)
+
+
+class ColumnarExporter:
+    def __init__(self, directory, definitions=None, chunk_rows=65536, chunk_seconds=10.0,
+                 flush_interval=1.0, fsync_every=8, max_segment_bytes=256 << 20,
+                 max_segment_seconds=3600.0, max_pending=500_000):
+        self.directory = directory
+        self.definitions = {d.can_id: d for d in definitions} if definitions else dict(MESSAGES)
+        self.chunk_rows = chunk_rows
+        self.chunk_seconds = chunk_seconds
+        self.flush_interval = flush_interval
+        self.fsync_every = fsync_every
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.max_pending = max_pending
+
+        self.frames = 0            # frames received
+        self.dropped = 0           # frames dropped, writer too slow
+        self.rows = 0              # rows written
+        self.chunks = 0
+        self.bytes = 0
+        self.segments = 0
+
+        self._pending = []         # (timestamp, can_id, data), reader thread
+        self._lock = threading.Lock()
+        self._columns = {}         # can_id -> list of {column: array} blocks of the open chunk
+        self._chunk_rows = 0
+        self._chunk_started = None
+        self._segment = None       # current segment directory
+        self._segment_started = 0.0
+        self._segment_bytes = 0
+        self._unsynced = []        # tmp paths waiting for fsync + rename
+        self._ifaces = []
+        self._stop = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        log.info("💾 Exporting %s to %s", ", ".join(d.name for d in self.definitions.values()), directory)
+
+    # ----------------------------------------------------------------
+    # Reader thread
+    # ----------------------------------------------------------------
+    def attach(self, iface):
+        """Subscribe to the exported IDs of a CANInterface (or RemoteCANInterface)"""
+        for can_id in self.definitions:
+            iface.add_callback(self.on_frame, can_id=can_id)
+        self._ifaces.append(iface)
+
+    def on_frame(self, msg):
+        with self._lock:
+            self.frames += 1
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append((msg.timestamp, msg.arbitration_id, msg.data))
+
+    # ----------------------------------------------------------------
+    # Writer thread
+    # ----------------------------------------------------------------
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._process()
+        self._process()
+        self._write_chunk()
+        self._sync()
+
+    def _process(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            if self._chunk_started is not None and time.time() - self._chunk_started >= self.chunk_seconds:
+                self._write_chunk()
+            return
+
+        by_key = {}                # (can_id, payload length) -> frames
+        for frame in pending:
+            by_key.setdefault((frame[1], len(frame[2])), []).append(frame)
+        for (can_id, size), frames in by_key.items():
+            definition = self.definitions.get(can_id)
+            if definition is None or size < definition.length:
+                continue
+            self._columns.setdefault(can_id, []).append(self._decode(definition, size, frames))
+            self._chunk_rows += len(frames) * (size // definition.length)
+        if self._chunk_started is None:
+            self._chunk_started = time.time()
+        if self._chunk_rows >= self.chunk_rows or time.time() - self._chunk_started >= self.chunk_seconds:
+            self._write_chunk()
+
+    @staticmethod
+    def _decode(definition, size, frames):
+        """Columns of frames sharing one payload length, packed samples unrolled"""
+        n = size // definition.length
+        payloads = np.frombuffer(b"".join(bytes(f[2]) for f in frames), np.uint8).reshape(len(frames), size)
+        payloads = payloads[:, :n * definition.length].reshape(len(frames) * n, definition.length)
+        t = np.fromiter((f[0] for f in frames), float, len(frames))
+        if n > 1:
+            t = (t[:, None] + definition.sample_times(0.0, n)[None, :]).ravel()
+        columns = definition.decode_array(payloads)
+        columns["t"] = t
+        return columns
+
+    def _write_chunk(self):
+        if not self._columns:
+            self._chunk_started = None
+            return
+        arrays = {}
+        for can_id, blocks in self._columns.items():
+            definition = self.definitions[can_id]
+            t = np.concatenate([b["t"] for b in blocks])
+            order = np.argsort(t, kind="stable") if len(blocks) > 1 else None
+            for column in ("t",) + definition.names:
+                values = np.concatenate([b[column] for b in blocks])
+                arrays[f"{definition.name}/{column}"] = values if order is None else values[order]
+            self.rows += len(t)
+        self._columns = {}
+        self._chunk_rows = 0
+        self._chunk_started = None
+
+        segment = self._current_segment()
+        self.chunks += 1
+        path = os.path.join(segment, f"chunk-{self.chunks:06d}.npz.tmp")
+        try:
+            with open(path, "wb") as f:
+                np.savez(f, **arrays)
+                size = f.tell()
+        except OSError as e:
+            log.error("❌ Export chunk %s not written: %s", path, e)
+            return
+        self.bytes += size
+        self._segment_bytes += size
+        self._unsynced.append(path)
+        if len(self._unsynced) >= self.fsync_every:
+            self._sync()
+
+    def _current_segment(self):
+        now = time.time()
+        if (self._segment is None or self._segment_bytes >= self.max_segment_bytes
+                or now - self._segment_started >= self.max_segment_seconds):
+            self._sync()
+            name = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+            number = self.segments + 1
+            while True:
+                # mkdir is atomic: another exporter (or a restart) in the same
+                # second on this directory takes the next number
+                segment = os.path.join(self.directory, f"{name}-{number:03d}")
+                try:
+                    os.mkdir(segment)
+                    break
+                except FileExistsError:
+                    number += 1
+            self._segment, self._segment_started, self._segment_bytes = segment, now, 0
+            self.segments += 1
+            log.info("💾 Export segment %s", segment)
+        return self._segment
+
+    def _sync(self):
+        """fsync the pending chunks, then make them visible (rename)"""
+        if not self._unsynced:
+            return
+        directories = set()
+        for path in self._unsynced:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                os.replace(path, path[:-len(".tmp")])
+                directories.add(os.path.dirname(path))
+            except OSError as e:
+                log.error("❌ Export chunk %s not synced: %s", path, e)
+        self._unsynced = []
+        for directory in directories:
+            # makes the renames durable; some filesystems refuse it (EINVAL)
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                log.error("❌ Export directory %s not synced: %s", directory, e)
+
+    # ----------------------------------------------------------------
+    # Control
+    # ----------------------------------------------------------------
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {"frames": self.frames, "dropped": self.dropped, "pending": pending, "rows": self.rows,
+                "chunks": self.chunks, "bytes": self.bytes, "segments": self.segments}
+
+    def close(self):
+        """Unsubscribe, write what is pending and sync"""
+        for iface in self._ifaces:
+            iface.remove_callback(self.on_frame)
+        self._ifaces = []
+        self._stop.set()
+        self._thread.join()
+        log.info("⏹️ Exported %d rows in %d chunks (%.1f MB, %d frames dropped) to %s",
+                 self.rows, self.chunks, self.bytes / 1e6, self.dropped, self.directory)
+
+
+# ================================================================
+# Reading
+# ================================================================
+def export_chunks(path):
+    """Chunk files of an export directory, a segment or a single chunk, in order"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(glob.glob(os.path.join(path, "**", "chunk-*.npz"), recursive=True))
+
+
+def load_export(path, messages=None, t0=None, t1=None):
+    """Load an export as {message name: {column: array}}.
+
+    Every column is concatenated once over all the chunks; `messages`
+    restricts the message names, `t0`/`t1` the time range.
+    """
+    parts = {}                 # message -> column -> [arrays]
+    for chunk in export_chunks(path):
+        with np.load(chunk) as npz:
+            for key in npz.files:
+                message, _, column = key.rpartition("/")
+                if messages is None or message in messages:
+                    parts.setdefault(message, {}).setdefault(column, []).append(npz[key])
+
+    data = {}
+    for message, columns in parts.items():
+        data[message] = {column: np.concatenate(arrays) for column, arrays in columns.items()}
+        if t0 is not None or t1 is not None:
+            t = data[message]["t"]
+            keep = np.ones(len(t), bool)
+            if t0 is not None:
+                keep &= t >= t0
+            if t1 is not None:
+                keep &= t <= t1
+            data[message] = {column: values[keep] for column, values in data[message].items()}
+    return data
@@ -0,0 +1,80 @@
+# frame_bridge.py
+import threading
+from collections import deque
+from PyQt5 import QtCore
+
+
+class FrameBridge(QtCore.QObject):
+    """Hand CAN frames from the receive thread over to the Qt GUI thread.
+
+    `push()` is meant to be registered as a CANInterface callback: it only
+    stores the frame under a lock and never touches a widget. A QTimer living
+    in the GUI thread drains the pending frames at `rate_hz` and emits
+    `frameReady` once per delivered frame, so the GUI cost follows the display
+    rate instead of the bus rate. With `rate_hz=None` there is no timer and
+    the owner calls `drain()` (e.g. view_model.RefreshLoop.before_render).
+
+    With `coalesce=True` (default) only the latest frame per arbitration ID is
+    kept between two drains. With `coalesce=False` every frame is kept, up to
+    `max_pending` frames (oldest are dropped first).
+    """
+    frameReady = QtCore.pyqtSignal(object)  # emitted in the GUI thread
+
+    def __init__(self, parent=None, rate_hz=60, coalesce=True, max_pending=10000):
+        super().__init__(parent)
+        self.coalesce = coalesce
+        self.received = 0      # frames pushed by the reader thread
+        self.delivered = 0     # frames emitted to the GUI
+        self.dropped = 0       # frames lost because the queue was full
+
+        self._lock = threading.Lock()
+        self._latest = {}                           # coalesce mode: ID -> msg
+        self._queue = deque(maxlen=max_pending)     # keep-all mode
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.drain)
+        if rate_hz:
+            self.set_rate(rate_hz)
+            self.timer.start()
+
+    def set_rate(self, rate_hz):
+        """Change the display rate (drains per second)"""
+        self.timer.setInterval(max(1, int(round(1000.0 / rate_hz))))
+
+    # ----------------------------------------------------------------
+    # Reader thread side
+    # ----------------------------------------------------------------
+    def push(self, msg):
+        """Queue a frame (safe to call from any thread)"""
+        with self._lock:
+            self.received += 1
+            if self.coalesce:
+                self._latest[msg.arbitration_id] = msg
+            else:
+                if len(self._queue) == self._queue.maxlen:
+                    self.dropped += 1
+                self._queue.append(msg)
+
+    # ----------------------------------------------------------------
+    # GUI thread side
+    # ----------------------------------------------------------------
+    def drain(self):
+        """Emit every pending frame, called by the timer in the GUI thread"""
+        with self._lock:
+            if self.coalesce:
+                if not self._latest:
+                    return
+                frames = list(self._latest.values())
+                self._latest.clear()
+            else:
+                if not self._queue:
+                    return
+                frames = list(self._queue)
+                self._queue.clear()
+
+        self.delivered += len(frames)
+        for msg in frames:
+            self.frameReady.emit(msg)
+
+    def stop(self):
+        self.timer.stop()
@@ -0,0 +1,106 @@
+# history_widget.py
+import pyqtgraph as pg
+from PyQt5 import QtWidgets, QtCore
+
+from signal_history import minmax_decimate
+from view_model import is_shown
+
+REFRESH_MS = 100
+
+
+class HistoryWidget(QtWidgets.QWidget):
+    """Trend plots of the wind speed and of the MPU attitude.
+
+    Only the visible time range is read from the history, decimated to
+    min/max pairs per pixel column, so redraw cost depends on the plot width
+    and not on how long the test has been running. Nothing is redrawn while
+    the view is hidden, or when neither the data nor the range changed.
+    """
+    CURVES = {
+        "rpm": [("rpm", "y")],
+        "attitude": [("roll", "r"), ("pitch", "g"), ("yaw", "b")],
+    }
+
+    def __init__(self, history):
+        super().__init__()
+        self.history = history
+        self.t0 = None   # time origin of the x axis (first sample)
+        layout = QtWidgets.QVBoxLayout(self)
+
+        # Follow mode: always show the last `span` seconds
+        controls = QtWidgets.QHBoxLayout()
+        self.follow = QtWidgets.QCheckBox("Follow")
+        self.follow.setChecked(True)
+        self.span = QtWidgets.QSpinBox()
+        self.span.setRange(5, 24 * 3600)
+        self.span.setValue(60)
+        self.span.setSuffix(" s")
+        controls.addWidget(self.follow)
+        controls.addWidget(self.span)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.plots = {}
+        self.curves = {}
+        for key, title in (("rpm", "Windmill speed (RPM)"), ("attitude", "Roll / Pitch / Yaw (°)")):
+            plot = pg.PlotWidget(title=title)
+            plot.showGrid(x=True, y=True, alpha=0.3)
+            plot.setLabel("bottom", "time", "s")
+            plot.addLegend()
+            for name, color in self.CURVES[key]:
+                self.curves[name] = plot.plot(pen=color, name=name)
+            # Panning/zooming leaves follow mode and redraws at once
+            plot.getViewBox().sigRangeChangedManually.connect(lambda *_: self.follow.setChecked(False))
+            plot.getViewBox().sigXRangeChanged.connect(self._schedule_redraw)
+            self.plots[key] = plot
+            layout.addWidget(plot)
+        self.plots["attitude"].setXLink(self.plots["rpm"])
+
+        self._redraw_pending = False
+        self._drawn = None        # (sample counts, x range, width) of the last redraw
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.redraw)
+        self.timer.start(REFRESH_MS)
+
+    def _schedule_redraw(self, *args):
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            QtCore.QTimer.singleShot(0, self.redraw)
+
+    def _time_origin(self):
+        if self.t0 is None:
+            spans = [b.time_span() for b in self.history.buffers.values()]
+            starts = [s[0] for s in spans if s]
+            if starts:
+                self.t0 = min(starts)
+        return self.t0
+
+    def redraw(self):
+        self._redraw_pending = False
+        if not is_shown(self):
+            return
+        t0 = self._time_origin()
+        if t0 is None:
+            return
+
+        view = self.plots["rpm"].getViewBox()
+        if self.follow.isChecked():
+            spans = [b.time_span() for b in self.history.buffers.values()]
+            end = max(s[1] for s in spans if s) - t0
+            view.blockSignals(True)
+            view.setXRange(end - self.span.value(), end, padding=0)
+            view.blockSignals(False)
+        x0, x1 = view.viewRange()[0]
+        n_bins = max(1, int(view.width()))
+        drawn = (tuple(b.head for b in self.history.buffers.values()), (x0, x1), n_bins)
+        if drawn == self._drawn:
+            return
+        self._drawn = drawn
+
+        for name, curve in self.curves.items():
+            buf = self.history.buffers.get(name)
+            if buf is None:
+                continue
+            t, y = buf.window(t0 + x0, t0 + x1)
+            t, y = minmax_decimate(t - t0, y, n_bins)
+            curve.setData(t, y)
@@ -0,0 +1,170 @@
+# latency_stats.py
+"""Request/response latency, poll jitter and missed replies per sensor."""
+import math
+import threading
+
+
+def format_ms(value):
+    """A duration in seconds as milliseconds for display, "–" if unknown"""
+    return "–" if value is None else f"{value * 1000:.2f}"
+
+
+class LatencyHistogram:
+    """Fixed log-spaced histogram of durations in seconds.
+
+    Adding a value is O(1) and allocation free; percentiles are read from the
+    bucket counts (resolution: `buckets_per_decade` buckets per x10).
+    """
+    def __init__(self, min_value=1e-6, max_value=10.0, buckets_per_decade=20):
+        self.min_value = min_value
+        self.buckets_per_decade = buckets_per_decade
+        self.nbuckets = int(math.ceil(math.log10(max_value / min_value) * buckets_per_decade)) + 1
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * self.nbuckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        if value <= self.min_value:
+            index = 0
+        else:
+            index = min(int(math.log10(value / self.min_value) * self.buckets_per_decade),
+                        self.nbuckets - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def _bucket_value(self, index):
+        # geometric middle of the bucket
+        return self.min_value * 10 ** ((index + 0.5) / self.buckets_per_decade)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+        }
+
+
+class SensorLatency:
+    """Round-trip statistics of one request ID / reply ID pair.
+
+    A request stays outstanding until the next reply; if a new request is
+    sent before that, the previous one counts as missed.
+    """
+    def __init__(self, request_id, reply_id, period=None):
+        self.request_id = request_id
+        self.reply_id = reply_id
+        self.period = period            # nominal poll period (s), for jitter
+        self.latency = LatencyHistogram()
+        self.jitter = LatencyHistogram()
+        self.reset()
+
+    def reset(self):
+        self.latency.reset()
+        self.jitter.reset()
+        self.requests = 0
+        self.replies = 0
+        self.missed = 0
+        self.unsolicited = 0            # replies without a pending request
+        self._outstanding = None
+        self._last_request = None
+
+    def on_request(self, t):
+        self.requests += 1
+        if self._outstanding is not None:
+            self.missed += 1
+        if self.period and self._last_request is not None:
+            interval = t - self._last_request
+            if interval < 10 * self.period:   # longer: polling was stopped
+                self.jitter.add(abs(interval - self.period))
+        self._outstanding = t
+        self._last_request = t
+
+    def on_reply(self, t):
+        if self._outstanding is None:
+            self.unsolicited += 1
+            return
+        self.latency.add(t - self._outstanding)
+        self.replies += 1
+        self._outstanding = None
+
+    def snapshot(self):
+        answered = self.replies + self.missed
+        return {
+            "request_id": self.request_id,
+            "reply_id": self.reply_id,
+            "requests": self.requests,
+            "replies": self.replies,
+            "missed": self.missed,
+            "unsolicited": self.unsolicited,
+            "loss": self.missed / answered if answered else 0.0,
+            "latency": self.latency.snapshot(),
+            "jitter": self.jitter.snapshot(),
+        }
+
+
+class RoundTripTracker:
+    """Correlate requests and replies of several sensors.
+
+    `on_frame()` is a CANInterface callback: frames transmitted by this host
+    (`is_rx == False`, looped back by the bus) are requests, received frames
+    with a tracked reply ID are replies. Timestamps are the frame timestamps.
+    """
+    def __init__(self):
+        self.sensors = {}      # request ID -> SensorLatency
+        self._by_reply = {}    # reply ID -> SensorLatency
+        self._lock = threading.Lock()
+
+    def track(self, request_id, reply_id, period=None):
+        with self._lock:
+            sensor = SensorLatency(request_id, reply_id, period)
+            self.sensors[request_id] = sensor
+            self._by_reply[reply_id] = sensor
+        return sensor
+
+    def set_period(self, request_id, period):
+        """Change the nominal poll period used for jitter (statistics kept)"""
+        sensor = self.sensors.get(request_id)
+        if sensor is not None:
+            sensor.period = period
+
+    def on_frame(self, msg):
+        with self._lock:
+            if not msg.is_rx:
+                sensor = self.sensors.get(msg.arbitration_id)
+                if sensor is not None:
+                    sensor.on_request(msg.timestamp)
+            else:
+                sensor = self._by_reply.get(msg.arbitration_id)
+                if sensor is not None:
+                    sensor.on_reply(msg.timestamp)
+
+    def reset(self):
+        with self._lock:
+            for sensor in self.sensors.values():
+                sensor.reset()
+
+    def snapshot(self):
+        """{request ID: statistics dict}"""
+        with self._lock:
+            return {can_id: s.snapshot() for can_id, s in self.sensors.items()}
@@ -10,6 +10,7 @@ from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QVector3D
 import pyqtgraph.opengl as gl
 from pyqtgraph.Qt import QtGui
+from can_signals import MPU_ANGLES
 
 class SensorGUI(QWidget):
     def __init__(self):
@@ -107,17 +108,15 @@ class SensorGUI(QWidget):
             print(f"General error: {e}")
 
     def handle_response(self, msg):
-        if msg.arbitration_id == 0x08 and len(msg.data) >= 6:  # MPU9250 response
-            phi = int.from_bytes(msg.data[0:2], byteorder='big', signed=True)
-            theta = int.from_bytes(msg.data[2:4], byteorder='big', signed=True)
-            psi = int.from_bytes(msg.data[4:6], byteorder='big', signed=True)
+        if msg.arbitration_id == 0x08 and len(msg.data) >= MPU_ANGLES.length:  # MPU9250 response
+            phi, theta, psi = MPU_ANGLES.decode_values(msg.data)
 
-            print(f"MPU9250 -> Roll: {phi/100:.2f}°, Pitch: {theta/100:.2f}°, Yaw: {psi/100:.2f}°")
+            print(f"MPU9250 -> Roll: {phi:.2f}°, Pitch: {theta:.2f}°, Yaw: {psi:.2f}°")
 
-            # Convert degrees * 100 to radians
-            roll = np.radians(phi )
-            pitch = np.radians(theta )
-            yaw = np.radians(psi )
+            # Degrees to radians
+            roll = np.radians(phi)
+            pitch = np.radians(theta)
+            yaw = np.radians(psi)
 
             self.update_cube_rotation(roll, pitch, yaw)
 
@@ -1,24 +1,79 @@
 # main_ihm.py
+import startup_timing as startup
+import argparse
+import logging
+import os
 import sys
-from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QStackedLayout, QLabel
-)
-from PyQt5.QtCore import QTimer
-from can_interface import CANInterface
-from mpu_widget import MPUWidget
-from anemo_widget import AnemoWidget
+import threading
+import time
+with startup.timed("import PyQt5"):
+    from PyQt5.QtWidgets import (
+        QApplication, QWidget, QVBoxLayout, QHBoxLayout,
+        QPushButton, QStackedLayout, QLabel, QShortcut
+    )
+    from PyQt5.QtCore import QTimer, pyqtSignal
+    from PyQt5.QtGui import QKeySequence
+with startup.timed("import dashboard modules"):
+    import profiling
+    from bus_logging import setup_logging
+    from can_signals import MPU_ANGLES, MPU_SAMPLE_PERIOD, WIND_SPEED, set_sample_periods
+    from frame_bridge import FrameBridge
+    from poll_scheduler import BITRATE, LOAD_BUDGET, SENSORS, PollScheduler, PolledSensor
+    from anemo_widget import AnemoWidget
+    from stats_widget import LatencyStatsWidget
+    from view_model import RefreshLoop, SignalModel
+# Heavy modules (python-can, NumPy, pyqtgraph, OpenGL) are imported on first
+# use: see _open_can() and the _create_*_view() methods.
+
+# Polled sensors, bitrate and bus-load budget: see poll_scheduler.SENSORS
+REFRESH_HZ = 60     # display frame rate
+
+# Displayed values: key -> deadband (changes up to this are not redrawn)
+DEADBANDS = {
+    "attitude": 0,      # MPU roll/pitch/yaw, degrees
+    "rpm": 0,           # anemometer speed
+}
+
+log = logging.getLogger(__name__)
 
 
 class MainIHM(QWidget):
-    def __init__(self):
+    canOpened = pyqtSignal(object)   # CAN interface opened by the background thread
+
+    def __init__(self, channel='can0', bustype='socketcan', iface=None, record=None,
+                 poll_rates=None, bitrate=BITRATE, metrics_port=None, fd=False, data_bitrate=None,
+                 pid_gains=None, export=None, deadbands=None):
         super().__init__()
         self.setWindowTitle("Sensor Dashboard")
         self.setGeometry(100, 100, 900, 700)
 
         # === CAN Interface ===
-        self.can = CANInterface('can0')
-        self.can.add_callback(self.handle_response)
+        # Frames are received on the CAN thread and handed to the GUI thread
+        # by the bridge, at most once per ID per display frame. The handlers
+        # only store decoded values in the model; the refresh loop redraws
+        # the views whose values changed, if shown (see view_model).
+        self.model = SignalModel(dict(DEADBANDS, **(deadbands or {})))
+        self.refresh = RefreshLoop(self.model, REFRESH_HZ, self)
+        self.bridge = FrameBridge(self, rate_hz=None)
+        self.bridge.frameReady.connect(self.handle_response)
+        self.refresh.before_render(self.bridge.drain)
+        self.can = None
+        self.record = record
+        self.export = export                # directory of the columnar export (data_export)
+        self.history = None
+        self.scheduler = None
+        self.motor = None                   # closed-loop motor control, once the bus is open
+        self.pid_gains = pid_gains
+        self.poll_rates = dict(poll_rates or {})   # sensor name -> Hz, overrides SENSORS
+        self.bitrate = bitrate
+        self.fd = fd                        # CAN FD: several MPU samples per reply
+        self.data_bitrate = data_bitrate or bitrate
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.active_sensor_id = None
+        self.motor_speed = 0
+        self.sampler = None                 # profiling.SamplingProfiler while F9 is on
+        self._timing_was_enabled = False
 
         # === Layouts ===
         main_layout = QVBoxLayout()
@@ -28,107 +83,313 @@ class MainIHM(QWidget):
         self.btn_mpu = QPushButton("MPU9250")
         self.btn_vl = QPushButton("VL6180X")
         self.btn_anemo = QPushButton("Anemometer")
+        self.btn_history = QPushButton("History")
 
         self.btn_mpu.clicked.connect(lambda: self.activate_sensor(0x02))
         self.btn_vl.clicked.connect(lambda: self.activate_sensor(0x01))
         self.btn_anemo.clicked.connect(lambda: self.activate_sensor(0x03))
+        self.btn_history.clicked.connect(lambda: self.show_view("history"))
 
-        for b in (self.btn_mpu, self.btn_vl, self.btn_anemo):
+        for b in (self.btn_mpu, self.btn_vl, self.btn_anemo, self.btn_history):
             button_layout.addWidget(b)
 
         main_layout.addLayout(button_layout)
 
         # === Sensor Views ===
+        # Built (and their modules imported) the first time they are shown
         self.view_stack = QStackedLayout()
+        self.view_factories = {
+            "mpu": self._create_mpu_view,
+            "vl": self._create_vl_view,
+            "anemo": self._create_anemo_view,
+            "history": self._create_history_view,
+        }
+        self.views = {}
+        self.mpu_widget = None
+        self.vl_widget = None
+        self.anemo_widget = None
+        self.history_widget = None
+        self.view_stack.addWidget(QLabel("Select a sensor"))
+        main_layout.addLayout(self.view_stack)
+
+        # === Round-trip statistics ===
+        self.stats_widget = LatencyStatsWidget(lambda: self.can.latency_stats() if self.can else {})
+        main_layout.addWidget(self.stats_widget)
+        self.poll_label = QLabel("Polling: CAN bus not open yet")
+        main_layout.addWidget(self.poll_label)
+
+        self.setLayout(main_layout)
+        QShortcut(QKeySequence("F9"), self, activated=self.toggle_profiler)
+
+        # === Reply handlers (by arbitration ID) ===
+        # Only these IDs are subscribed, everything else is filtered by the kernel.
+        self.frame_handlers = {
+            0x08: self.update_attitude,     # MPU9250 reply
+            0x09: self.update_wind_speed,   # Anemometer reply
+        }
+
+        # `iface` can be an acquisition.RemoteCANInterface (separate process)
+        # or an interface opened by the caller; otherwise the bus is opened in
+        # the background so that the window shows up at once.
+        self.canOpened.connect(self._on_can_opened)
+        if iface is not None:
+            self._on_can_opened(iface)
+        else:
+            threading.Thread(target=self._open_can, args=(channel, bustype), daemon=True).start()
 
+    # ---------------------------------------------------------------
+    # CAN opening (background thread) and wiring (GUI thread)
+    # ---------------------------------------------------------------
+    def _open_can(self, channel, bustype):
+        with startup.timed("import can_interface (python-can)"):
+            from can_interface import CANInterface
+        with startup.timed("open CAN bus"):
+            iface = CANInterface(channel, bustype, fd=self.fd)
+        with startup.timed("import signal_history (NumPy)"):
+            import signal_history  # noqa: F401  (warm-up, used by _ensure_history)
+        self.canOpened.emit(iface)
+
+    def _on_can_opened(self, iface):
+        self.can = iface
+        if self.record:
+            self.can.start_recording(self.record)
+        if self.export:
+            self.can.start_export(self.export)
+        metrics = getattr(self.can, "metrics", None)   # not with --acquisition
+        if metrics is not None:
+            metrics.set_bitrate(self.bitrate, self.data_bitrate)
+            if self.metrics_port:
+                from bus_metrics import serve_metrics
+                self.metrics_server = serve_metrics([metrics], self.metrics_port)
+        for can_id in self.frame_handlers:
+            self.can.add_callback(self.bridge.push, can_id=can_id)
+        self._ensure_history()
+        self._start_polling()
+
+        # Closed-loop motor control runs next to the receive loop: in this
+        # process, or in the acquisition process with --acquisition
+        from motor_control import DEFAULT_GAINS, MotorController
+        gains = self.pid_gains or DEFAULT_GAINS
+        self.motor = getattr(self.can, "motor", None)
+        if self.motor is None:
+            self.motor = MotorController(self.can, gains)
+        else:
+            self.motor.set_gains(*gains)
+        if self.anemo_widget is not None and self.anemo_widget.closed_loop.isChecked():
+            self.set_closed_loop(True)
+        startup.mark("CAN ready")
+        startup.report()
+
+    def _ensure_history(self):
+        # Every decoded sample is kept (not only the displayed ones), fed
+        # from the CAN thread
+        if self.history is None and self.can is not None:
+            from signal_history import SignalHistory
+            self.history = SignalHistory()
+            self.history.attach(self.can, MPU_ANGLES)
+            self.history.attach(self.can, WIND_SPEED)
+        return self.history
+
+    # ---------------------------------------------------------------
+    # Lazy views
+    # ---------------------------------------------------------------
+    def show_view(self, key):
+        view = self.views.get(key)
+        if view is None:
+            with startup.timed(f"create view '{key}'"):
+                view = self.view_factories[key]()
+            if view is None:
+                return
+            self.views[key] = view
+            self.view_stack.addWidget(view)
+        self.view_stack.setCurrentWidget(view)
+
+    def _create_mpu_view(self):
+        from mpu_widget import MPUWidget
         self.mpu_widget = MPUWidget()
+        self.refresh.bind(self.mpu_widget, ("attitude",), self.mpu_widget.set_attitude)
+        return self.mpu_widget
+
+    def _create_vl_view(self):
         self.vl_widget = QLabel("VL6180X — (ignored for now)")
-        self.anemo_widget = AnemoWidget()
+        return self.vl_widget
 
+    def _create_anemo_view(self):
+        self.anemo_widget = AnemoWidget()
+        self.anemo_widget.slider.setValue(self.motor_speed)
         # Connect slider to CAN command
         self.anemo_widget.speedChanged.connect(self.send_motor_command)
+        self.anemo_widget.closedLoopChanged.connect(self.set_closed_loop)
+        self.anemo_widget.targetChanged.connect(self.set_target_rpm)
+        self.refresh.bind(self.anemo_widget, ("rpm",), self.anemo_widget.update_wind_speed)
+        self.loop_timer = QTimer(self)
+        self.loop_timer.timeout.connect(self.refresh_loop_stats)
+        self.loop_timer.start(250)
+        return self.anemo_widget
 
-        self.view_stack.addWidget(self.mpu_widget)
-        self.view_stack.addWidget(self.vl_widget)
-        self.view_stack.addWidget(self.anemo_widget)
-
-        main_layout.addLayout(self.view_stack)
-        self.setLayout(main_layout)
-
-        # === CAN Polling Timer ===
-        self.active_sensor_id = None
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.request_data)
+    def _create_history_view(self):
+        if self._ensure_history() is None:
+            log.warning("⚠️ History is available once the CAN bus is open")
+            return None
+        from history_widget import HistoryWidget
+        self.history_widget = HistoryWidget(self.history)
+        return self.history_widget
 
     # ---------------------------------------------------------------
     # Sensor activation
     # ---------------------------------------------------------------
     def activate_sensor(self, sensor_id):
-        print(f"🔵 activate_sensor called with ID=0x{sensor_id:X}")
+        # Polling goes on for every sensor, only the view changes
+        log.info("🔵 activate_sensor called with ID=0x%X", sensor_id)
         self.active_sensor_id = sensor_id
-        self.timer.start(10)  # send every 10 ms
-        print(f"✅ Timer started ({self.timer.interval()} ms)")
 
         if sensor_id == 0x02:
-            self.view_stack.setCurrentWidget(self.mpu_widget)
+            self.show_view("mpu")
         elif sensor_id == 0x01:
-            self.view_stack.setCurrentWidget(self.vl_widget)
+            self.show_view("vl")
         elif sensor_id == 0x03:
-            self.view_stack.setCurrentWidget(self.anemo_widget)
+            self.show_view("anemo")
+
+    def _start_polling(self):
+        self.scheduler = PollScheduler(self.can, self.bitrate, LOAD_BUDGET, data_bitrate=self.data_bitrate)
+        for name, (request_id, reply_id, reply_dlc, rate, priority) in SENSORS.items():
+            rate = self.poll_rates.get(name, rate)
+            if rate <= 0:
+                continue
+            if reply_id is not None:
+                self.can.track_round_trip(request_id, reply_id, 1.0 / rate)
+            if self.fd:
+                reply_dlc = 64     # worst case: replies may pack several samples
+            self.scheduler.add(PolledSensor(name, request_id, rate, self.request_payload(request_id),
+                                            reply_id, reply_dlc, priority, fd=self.fd))
+        self.scheduler.start()
+        self.poll_label.setText("Polling: " + ", ".join(
+            f"{s['name']} {s['effective_hz']:.3g} Hz" for s in self.scheduler.status()["sensors"].values()
+        ) + f" — estimated bus load {self.scheduler.load() * 100:.1f}%")
 
     # ---------------------------------------------------------------
-    # Periodic CAN request
+    # Periodic CAN request payload
     # ---------------------------------------------------------------
-    def request_data(self):
-        if self.active_sensor_id:
-            try:
-                # If it's the VL6180X, send current motor speed
-                if self.active_sensor_id == 0x01:
-                    speed = self.anemo_widget.slider.value()
-                    self.can.send_message(0x01, [speed])
-                    print(f"⚡ Sent speed {speed} to sensor ID 0x01")
-                
-                elif self.active_sensor_id == 0x03:  # Anemometer
-                    speed = self.anemo_widget.slider.value()
-                    self.can.send_message(0x03, [speed])
-                    print(f"⚡ Sent speed {speed} to sensor ID 0x03")
-                else:
-                    self.can.send_message(self.active_sensor_id, [1])
-            except Exception as e:
-                print(f"❌ Error sending CAN frame: {e}")
+    def request_payload(self, sensor_id):
+        # VL6180X and anemometer requests carry the current motor speed
+        if sensor_id in (0x01, 0x03):
+            return [self.motor_speed]
+        return [1]
 
     # ---------------------------------------------------------------
-    # Send slider value manually (optional, also used in request_data)
+    # Slider moved: update the payload of the running requests
     # ---------------------------------------------------------------
     def send_motor_command(self, value):
-        if self.active_sensor_id == 0x01:  # only send if sensor 0x01 is active
-            try:
-                self.can.send_message(0x01, [value])
-                print(f"⚡ Slider moved: sent {value} to CAN ID 0x01")
-            except Exception as e:
-                print(f"❌ Failed to send motor command: {e}")
+        self.motor_speed = value
+        if self.scheduler is None:
+            return
+        for sensor_id in (0x01, 0x03):
+            if sensor_id in self.scheduler.sensors:
+                self.scheduler.set_payload(sensor_id, [value])
+        log.info("⚡ Slider moved: requests now carry %d", value, extra={"category": "slider"})
+
+    # ---------------------------------------------------------------
+    # Closed-loop motor control: the GUI only sets the target
+    # ---------------------------------------------------------------
+    def set_closed_loop(self, enabled):
+        if self.motor is None or self.scheduler is None:
+            return                          # applied in _on_can_opened
+        if enabled:
+            # the controller sends 0x03 itself, clocked by the 0x09 replies
+            self.scheduler.pause(0x03)
+            self.motor.enable(self.anemo_widget.target.value())
+        else:
+            self.motor.disable()
+            self.scheduler.set_payload(0x03, [self.motor_speed])
+            self.scheduler.resume(0x03)
+
+    def set_target_rpm(self, rpm):
+        if self.motor is not None:
+            self.motor.set_target(rpm)
+
+    def refresh_loop_stats(self):
+        if self.motor is not None and self.motor.enabled and self.anemo_widget.isVisible():
+            self.anemo_widget.update_loop_stats(self.motor.stats())
 
     # ---------------------------------------------------------------
     # Handle responses from STM
     # ---------------------------------------------------------------
     def handle_response(self, msg):
-        print(f"📨 Received CAN frame: ID=0x{msg.arbitration_id:X}, Data={list(msg.data)}")
-
-        if msg.arbitration_id == 0x08:  # MPU9250 reply
-            self.mpu_widget.update_from_can(msg)
-        
-        elif msg.arbitration_id == 0x09:
-            if len(msg.data) >= 1:
-                rpm = msg.data[0]
-                self.anemo_widget.update_wind_speed(rpm)
-                print(f"🌬️ Windmill speed updated: {rpm} RPM")
-            else:
-                print("⚠️ Invalid data for wind speed frame")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("📨 Received CAN frame: ID=0x%X, Data=%s", msg.arbitration_id, list(msg.data),
+                      extra={"category": ("gui", msg.arbitration_id)})
+
+        handler = self.frame_handlers.get(msg.arbitration_id)
+        if handler:
+            profiling.timer.call_callback(handler, msg)
+
+    def update_attitude(self, msg):
+        if len(msg.data) >= MPU_ANGLES.length:
+            # a CAN FD frame may carry several samples, only the newest one is shown
+            self.model.set("attitude", MPU_ANGLES.latest_values(msg.data))
+
+    def update_wind_speed(self, msg):
+        if len(msg.data) >= WIND_SPEED.length:
+            rpm, = WIND_SPEED.decode_values(msg.data)
+            if self.model.set("rpm", rpm):
+                log.debug("🌬️ Windmill speed updated: %d RPM", rpm, extra={"category": "wind speed"})
+        else:
+            log.warning("⚠️ Invalid data for wind speed frame", extra={"category": "wind speed"})
+
+    # ---------------------------------------------------------------
+    # Profiling (F9)
+    # ---------------------------------------------------------------
+    def toggle_profiler(self):
+        """Start/stop the sampling profiler on the CAN reader and GUI threads.
+
+        Handler timing is on while sampling; on stop both reports are logged
+        and the stacks are written next to the working directory (folded format).
+        """
+        if self.sampler is None:
+            self._timing_was_enabled = profiling.timer.enabled
+            profiling.timer.reset()
+            profiling.timer.enabled = True
+            threads = {"gui": threading.main_thread()}
+            reader = getattr(self.can, "thread", None)   # CANInterface or RemoteCANInterface
+            if reader is not None:
+                threads["can reader"] = reader
+            self.sampler = profiling.SamplingProfiler(threads)
+            self.sampler.start()
+            return
+        sampler, self.sampler = self.sampler, None
+        sampler.stop()
+        path = sampler.dump(time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+        log.warning("%s\n%s\n🔬 Stacks written to %s", sampler.report(), profiling.timer.report(), path)
+        profiling.timer.enabled = self._timing_was_enabled
+
     # ---------------------------------------------------------------
     # Cleanup
     # ---------------------------------------------------------------
+    def showEvent(self, e):
+        super().showEvent(e)
+        if not getattr(self, "_shown_once", False):
+            self._shown_once = True
+            startup.mark("window shown")
+            QTimer.singleShot(0, lambda: startup.report("Window visible"))
+
     def closeEvent(self, e):
-        self.can.close()
+        if self.sampler is not None:
+            self.toggle_profiler()
+        elif profiling.timer.enabled:
+            log.warning(profiling.timer.report())
+        self.refresh.stop()
+        self.bridge.stop()
+        if self.motor is not None:
+            if self.motor.enabled and self.scheduler is not None:
+                self.set_closed_loop(False)     # 0x03 is polled again
+            self.motor.disable()
+        if self.scheduler is not None:
+            # with --acquisition the polls go on without the GUI
+            self.scheduler.detach()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        if self.can is not None:
+            self.can.close()
         e.accept()
 
 
@@ -136,7 +397,71 @@ class MainIHM(QWidget):
 # Entry point
 # ================================================================
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    win = MainIHM()
+    parser = argparse.ArgumentParser(description="Sensor dashboard")
+    parser.add_argument("--channel", default="can0")
+    parser.add_argument("--bustype", default="socketcan")
+    parser.add_argument("--record", metavar="FILE", help="record the session (bus_recorder format)")
+    parser.add_argument("--export", metavar="DIR",
+                        help="export the decoded MPU and anemometer signals (data_export format)")
+    parser.add_argument("--replay", metavar="FILE", help="replay a recording instead of using the hardware")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 0 = as fast as possible")
+    parser.add_argument("--acquisition", metavar="NAME",
+                        help="read from a running acquisition.py process instead of opening the bus")
+    parser.add_argument("--poll-rate", metavar="SENSOR=HZ", action="append", default=[],
+                        help=f"poll rate of a sensor ({', '.join(SENSORS)}), 0 = not polled")
+    parser.add_argument("--deadband", metavar="VALUE=DELTA", action="append", default=[],
+                        help=f"redraw {', '.join(DEADBANDS)} only when it moves by more than DELTA")
+    parser.add_argument("--bitrate", type=int, default=BITRATE, help="bus bitrate, for the load estimate")
+    parser.add_argument("--fd", action="store_true", help="use CAN FD (bitrate switching)")
+    parser.add_argument("--mpu-sample-period", type=float, default=MPU_SAMPLE_PERIOD, metavar="S",
+                        help="time between the MPU samples packed in a CAN FD reply (assumed 1 ms)")
+    parser.add_argument("--data-bitrate", type=int, help="CAN FD data bitrate, for the load estimate")
+    parser.add_argument("--pid", type=float, nargs=3, metavar=("KP", "KI", "KD"),
+                        help="gains of the closed-loop motor control")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="report import and construction costs at startup")
+    parser.add_argument("--profile", action="store_true",
+                        help="time every CAN callback and GUI handler (report on exit; F9: sampling profiler)")
+    parser.add_argument("--handler-budget", type=float, default=profiling.DEFAULT_BUDGET * 1e6, metavar="US",
+                        help="warn about handler calls longer than this (µs)")
+    args, qt_args = parser.parse_known_args()
+    set_sample_periods({MPU_ANGLES.can_id: args.mpu_sample_period})
+    poll_rates = {}
+    for item in args.poll_rate:
+        name, _, rate = item.partition("=")
+        if name not in SENSORS:
+            parser.error(f"unknown sensor '{name}'")
+        poll_rates[name] = float(rate)
+    deadbands = {}
+    for item in args.deadband:
+        name, _, delta = item.partition("=")
+        if name not in DEADBANDS:
+            parser.error(f"unknown value '{name}'")
+        deadbands[name] = float(delta)
+    options = {"poll_rates": poll_rates, "bitrate": args.bitrate, "metrics_port": args.metrics_port,
+               "fd": args.fd, "data_bitrate": args.data_bitrate, "pid_gains": args.pid,
+               "export": args.export, "deadbands": deadbands}
+
+    # Log level from the environment, e.g. BUSCAN_LOG=DEBUG python main_ihm.py
+    setup_logging(os.environ.get("BUSCAN_LOG", "INFO").upper())
+    startup.enabled = args.startup_profile
+    profiling.timer.enabled = args.profile
+    profiling.timer.budget = args.handler_budget * 1e-6
+    app = QApplication(sys.argv[:1] + qt_args)
+    if args.replay:
+        # python-can virtual bus: no hardware needed
+        from can_interface import CANInterface
+        from bus_recorder import BusReplayer
+        iface = CANInterface('replay', 'virtual', fd=args.fd)
+        win = MainIHM(iface=iface, record=args.record, **options)
+        replayer = BusReplayer(args.replay, iface, args.speed)
+        replayer.start()
+    elif args.acquisition:
+        from acquisition import RemoteCANInterface
+        win = MainIHM(iface=RemoteCANInterface(args.acquisition), **options)
+    else:
+        win = MainIHM(args.channel, args.bustype, record=args.record, **options)
     win.show()
     sys.exit(app.exec_())
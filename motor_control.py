@@ -0,0 +1,210 @@
+# motor_control.py
+"""Closed-loop speed control of the anemometer motor.
+
+The controller runs on the CAN reader thread (CANInterface callback): each
+RPM reply (0x09) is decoded, fed to the PID and the next motor command (0x03,
+which is also the anemometer request) is sent at once with `bus.send` from
+the reader thread, in the same wakeup (CANInterface.send_now). The transmit
+queue is only a fallback, when the direct send fails or the interface has
+none. The loop is clocked by the replies themselves, so the periodic 0x03
+poll must be paused while it runs (MainIHM does it through the PollScheduler):
+
+- commands never leave faster than `max_rate_hz`: a reply arriving earlier
+  has its command deferred and sent through the transmit queue by the pacer
+  thread when due, computed from the newest measurement (max_rate_hz=None
+  sends every command in the reply's wakeup);
+- the pacer thread also re-sends the last command when no reply came for
+  `timeout` seconds, so a lost frame does not stop the loop.
+
+The GUI only sets the target and reads `stats()`.
+"""
+import logging
+import threading
+import time
+
+from can_signals import WIND_SPEED
+from latency_stats import LatencyHistogram
+from tx_queue import PRIORITY_HIGH
+
+log = logging.getLogger(__name__)
+
+MOTOR_COMMAND_ID = 0x03
+DEFAULT_GAINS = (0.5, 2.0, 0.0)   # kp, ki (1/s), kd (s): command units per RPM
+
+
+class PID:
+    """PID controller with output limits and anti-windup.
+
+    The integral is kept in output units and only integrates when the output
+    is not saturated, or when the error drives it back out of saturation
+    (conditional integration). The derivative acts on the measurement, so a
+    setpoint step does not kick the output.
+    """
+    def __init__(self, kp, ki=0.0, kd=0.0, out_min=0.0, out_max=255.0):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.out_min = out_min
+        self.out_max = out_max
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self._last_measurement = None
+
+    def update(self, setpoint, measurement, dt):
+        error = setpoint - measurement
+        p = self.kp * error
+        d = 0.0
+        if dt > 0 and self._last_measurement is not None:
+            d = -self.kd * (measurement - self._last_measurement) / dt
+        self._last_measurement = measurement
+
+        integral = self.integral + self.ki * error * dt if dt > 0 else self.integral
+        output = p + integral + d
+        if output > self.out_max:
+            if error < 0:
+                self.integral = integral
+            output = self.out_max
+        elif output < self.out_min:
+            if error > 0:
+                self.integral = integral
+            output = self.out_min
+        else:
+            self.integral = integral
+        self.integral = min(max(self.integral, self.out_min), self.out_max)
+        return output
+
+
+class MotorController:
+    """Anemometer speed loop on a CANInterface (or its acquisition process)"""
+    def __init__(self, iface, gains=DEFAULT_GAINS, max_rate_hz=100.0, timeout=0.1,
+                 command_id=MOTOR_COMMAND_ID, feedback=WIND_SPEED, out_min=0, out_max=255):
+        self.iface = iface
+        self.pid = PID(*gains, out_min=out_min, out_max=out_max)
+        self.command_id = command_id
+        self.feedback = feedback
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz else 0.0
+        self.timeout = timeout
+        self.enabled = False
+        self.target = 0.0
+        self.rpm = None
+        self.error = None
+        self.command = 0
+        self.commands = 0           # commands sent
+        self.timeouts = 0           # re-sent because no reply came
+        self.loop_time = LatencyHistogram()   # reply received -> command sent (or deferred)
+        self._error_sq = 0.0
+        self._error_n = 0
+        self._stats_at = (time.time(), 0)     # (time, commands) of the previous stats()
+        self._last_feedback = None  # timestamp of the previous reply
+        self._last_sent = 0.0
+        self._due = None            # deferred command (max_rate_hz)
+        self._cond = threading.Condition()
+        self._thread = None
+
+    # ----------------------------------------------------------------
+    # GUI side
+    # ----------------------------------------------------------------
+    def enable(self, target=None):
+        with self._cond:
+            if target is not None:
+                self.target = float(target)
+            if self.enabled:
+                return
+            self.enabled = True
+            self.pid.reset()
+            self._last_feedback = None
+            self._last_sent = 0.0     # the pacer thread sends the first command at once
+        latency = getattr(self.iface, "latency", None)
+        if latency is not None and self.min_interval:
+            latency.set_period(self.command_id, self.min_interval)
+        self.iface.add_callback(self.on_feedback, can_id=self.feedback.can_id)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        log.info("🎯 Closed-loop motor control on, target %g RPM", self.target)
+
+    def disable(self):
+        with self._cond:
+            if not self.enabled:
+                return
+            self.enabled = False
+            self._cond.notify()
+        self.iface.remove_callback(self.on_feedback)
+        self._thread.join(timeout=1.0)
+        log.info("🎯 Closed-loop motor control off")
+
+    def set_target(self, rpm):
+        self.target = float(rpm)
+
+    def set_gains(self, kp, ki, kd):
+        with self._cond:
+            self.pid.kp, self.pid.ki, self.pid.kd = kp, ki, kd
+
+    def stats(self):
+        """Loop state; `rms_error` and `rate_hz` are since the previous call"""
+        with self._cond:
+            now = time.time()
+            rms = (self._error_sq / self._error_n) ** 0.5 if self._error_n else None
+            rate = (self.commands - self._stats_at[1]) / max(now - self._stats_at[0], 1e-9)
+            self._error_sq, self._error_n = 0.0, 0
+            self._stats_at = (now, self.commands)
+            return {
+                "enabled": self.enabled, "target": self.target, "rpm": self.rpm,
+                "error": self.error, "rms_error": rms, "command": self.command,
+                "commands": self.commands, "timeouts": self.timeouts, "rate_hz": rate,
+                "gains": (self.pid.kp, self.pid.ki, self.pid.kd),
+                "loop_time": self.loop_time.snapshot(),
+            }
+
+    # ----------------------------------------------------------------
+    # Reader thread
+    # ----------------------------------------------------------------
+    def on_feedback(self, msg):
+        if len(msg.data) < self.feedback.length:
+            return
+        rpm, = self.feedback.latest_values(msg.data)
+        with self._cond:
+            if not self.enabled:
+                return
+            dt = msg.timestamp - self._last_feedback if self._last_feedback is not None else 0.0
+            self._last_feedback = msg.timestamp
+            output = self.pid.update(self.target, rpm, dt)
+            self.rpm = rpm
+            self.error = self.target - rpm
+            self._error_sq += self.error * self.error
+            self._error_n += 1
+            self.command = int(round(output))
+
+            now = time.time()
+            due = self._last_sent + self.min_interval
+            if now >= due:
+                self._send(now, direct=True)
+            else:
+                self._due = due
+                self._cond.notify()
+            self.loop_time.add(time.time() - msg.timestamp)
+
+    def _send(self, now, direct=False):
+        send_now = getattr(self.iface, "send_now", None) if direct else None
+        if send_now is None or not send_now(self.command_id, [self.command]):
+            self.iface.send_message(self.command_id, [self.command], PRIORITY_HIGH)
+        self._last_sent = now
+        self._due = None
+        self.commands += 1
+
+    # ----------------------------------------------------------------
+    # Pacer / watchdog thread
+    # ----------------------------------------------------------------
+    def _run(self):
+        with self._cond:
+            while self.enabled:
+                now = time.time()
+                if self._due is not None and now >= self._due:
+                    self._send(now)
+                    continue
+                if now - self._last_sent >= self.timeout:
+                    if self._last_sent:
+                        self.timeouts += 1
+                    self._send(now)
+                    continue
+                deadline = self._due if self._due is not None else self._last_sent + self.timeout
+                self._cond.wait(deadline - now)
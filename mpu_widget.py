@@ -2,13 +2,21 @@
 import numpy as np
 import math
 import pyqtgraph.opengl as gl
-from PyQt5 import QtWidgets
+from PyQt5 import QtWidgets, QtGui
+import profiling
+
+
+class _TimedGLView(gl.GLViewWidget):
+    """GLViewWidget whose redraws are timed by profiling.timer"""
+    def paintGL(self, *args):
+        profiling.timer.call("MPUWidget.paintGL", super().paintGL, *args)
+
 
 class MPUWidget(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
         layout = QtWidgets.QVBoxLayout(self)
-        self.view = gl.GLViewWidget()
+        self.view = _TimedGLView()
         layout.addWidget(self.view)
         self.view.setCameraPosition(distance=10, elevation=15, azimuth=45)
 
@@ -30,51 +38,35 @@ class MPUWidget(QtWidgets.QWidget):
         self.cube.setGLOptions('opaque')
         self.view.addItem(self.cube)
 
+        # Orientation is applied as the cube model transform (the mesh is
+        # uploaded once). In the dashboard set_attitude() is called by the
+        # view_model.RefreshLoop, once per display frame at most and only
+        # when the angles changed while the view is shown.
+        self._matrix = np.eye(4)
+
     # ----------------------------------------------------------------
     # Update with new CAN data (MPU angles)
     # ----------------------------------------------------------------
-    def update_from_can(self, msg):
-        if len(msg.data) < 6:
-            return
-
-        # Extract signed 16-bit values
-        phi = int.from_bytes(msg.data[0:2], byteorder='big', signed=True)
-        theta = int.from_bytes(msg.data[2:4], byteorder='big', signed=True)
-        psi = int.from_bytes(msg.data[4:6], byteorder='big', signed=True)
-        # Convert to degrees then radians
-        roll = math.radians(phi )
-        pitch = math.radians(theta )
-        yaw = math.radians(psi )
-
-        self.update_cube_rotation(roll, pitch, yaw)
+    def set_attitude(self, angles):
+        """Show (roll, pitch, yaw) in degrees"""
+        phi, theta, psi = angles
+        self.update_cube_rotation(math.radians(phi), math.radians(theta), math.radians(psi))
 
     # ----------------------------------------------------------------
     # Rotation math (Z-Y-X)
     # ----------------------------------------------------------------
     def update_cube_rotation(self, roll, pitch, yaw):
-        Rx = np.array([
-            [1, 0, 0],
-            [0, math.cos(roll), -math.sin(roll)],
-            [0, math.sin(roll), math.cos(roll)]
-        ])
-        Ry = np.array([
-            [math.cos(pitch), 0, math.sin(pitch)],
-            [0, 1, 0],
-            [-math.sin(pitch), 0, math.cos(pitch)]
-        ])
-        Rz = np.array([
-            [math.cos(yaw), -math.sin(yaw), 0],
-            [math.sin(yaw), math.cos(yaw), 0],
-            [0, 0, 1]
-        ])
+        cr, sr = math.cos(roll), math.sin(roll)
+        cp, sp = math.cos(pitch), math.sin(pitch)
+        cy, sy = math.cos(yaw), math.sin(yaw)
 
-        R = Rz @ Ry @ Rx  # Combined rotation
-
-        # Apply to vertices
-        verts = self.original_vertices
-        rotated = np.dot(verts, R.T)
-        self.meshdata.setVertexes(rotated)
-        self.cube.meshDataChanged()
+        # R = Rz @ Ry @ Rx, written into the preallocated model matrix
+        self._matrix[:3, :3] = (
+            (cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr),
+            (sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr),
+            (-sp,     cp * sr,                cp * cr),
+        )
+        self.cube.setTransform(QtGui.QMatrix4x4(*self._matrix.ravel().tolist()))
 
     # ----------------------------------------------------------------
     # Cube definition (simple colors)
@@ -90,7 +82,6 @@ class MPUWidget(QtWidgets.QWidget):
             [ 1,  1, -1],
             [ 1,  1,  1],
         ])
-        self.original_vertices = verts.copy()
 
         faces = np.array([
             [0, 1, 3], [0, 3, 2],   # left
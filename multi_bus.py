@@ -0,0 +1,163 @@
+# multi_bus.py
+import logging
+import os
+import selectors
+import threading
+
+import can
+
+from can_interface import DispatchTable
+
+log = logging.getLogger(__name__)
+
+
+class MultiBusInterface:
+    """Several SocketCAN channels served by one reader thread.
+
+    Every bus socket is registered in a selector (epoll on Linux); the reader
+    thread sleeps in `select()` without timeout and drains whichever socket
+    became readable. Frames are tagged with their channel (`msg.channel`) and
+    routed to the callbacks registered for that channel and to the ones
+    registered for all channels.
+
+        buses = MultiBusInterface(['can0', 'can1', 'vcan0'])
+        buses.add_callback(on_mpu, channel='can0', can_id=0x08)
+        buses.add_callback(recorder.record)            # every channel
+
+    Only buses with a file descriptor can be used (socketcan, vcan).
+    """
+    def __init__(self, channels=('can0',), bustype='socketcan'):
+        self.buses = {}            # channel -> python-can bus
+        self.dispatch = {}         # channel -> DispatchTable
+        self.any_channel = DispatchTable()
+        self.running = False
+        self._selector = selectors.DefaultSelector()
+
+        # self-pipe, lets close() wake the reader without a poll timeout
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+
+        for channel in channels:
+            self.open(channel, bustype)
+
+        self.running = True
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+
+    def open(self, channel, bustype='socketcan'):
+        """Open one more channel (can be called while running)"""
+        log.info("🔧 Opening CAN bus '%s' using %s …", channel, bustype)
+        bus = can.interface.Bus(channel=channel, bustype=bustype, receive_own_messages=True)
+        try:
+            fd = bus.fileno()
+        except NotImplementedError:
+            fd = -1
+        if fd < 0:
+            bus.shutdown()
+            raise ValueError(f"bus '{channel}' ({bustype}) has no file descriptor, "
+                             "use CANInterface for it instead")
+        self.buses[channel] = bus
+        self.dispatch[channel] = DispatchTable()
+        self._apply_filters(channel)
+        self._selector.register(fd, selectors.EVENT_READ, channel)
+        log.info("✅ CAN bus '%s' opened", channel)
+
+    # ----------------------------------------------------------------
+    # Reader thread
+    # ----------------------------------------------------------------
+    def _read_loop(self):
+        any_channel = self.any_channel
+        while self.running:
+            for key, _ in self._selector.select():
+                channel = key.data
+                if channel is None:            # woken up by close()
+                    try:
+                        os.read(self._wake_r, 64)
+                    except BlockingIOError:
+                        pass
+                    continue
+                bus = self.buses.get(channel)
+                if bus is None:
+                    continue
+                table = self.dispatch[channel]
+                try:
+                    msg = bus.recv(timeout=0)
+                    while msg is not None:     # drain the socket
+                        msg.channel = channel
+                        table.dispatch(msg)
+                        any_channel.dispatch(msg)
+                        msg = bus.recv(timeout=0)
+                except can.CanError as e:
+                    log.warning("⚠️ CAN read error on %s: %s", channel, e,
+                                extra={"category": ("rx error", channel)})
+
+    def inject(self, msg, channel=None):
+        """Deliver a frame to the callbacks as if received on `channel`"""
+        channel = channel or msg.channel
+        msg.channel = channel
+        table = self.dispatch.get(channel)
+        if table is not None:
+            table.dispatch(msg)
+        self.any_channel.dispatch(msg)
+
+    # ----------------------------------------------------------------
+    # Callbacks and filters
+    # ----------------------------------------------------------------
+    def add_callback(self, callback, channel=None, can_id=None, mask=None):
+        """Register a callback on one channel (or all if None), see CANInterface.add_callback"""
+        table = self.any_channel if channel is None else self.dispatch[channel]
+        table.add(callback, can_id, mask)
+        self._apply_filters(channel)
+
+    def remove_callback(self, callback):
+        self.any_channel.remove(callback)
+        for table in self.dispatch.values():
+            table.remove(callback)
+        self._apply_filters()
+
+    def _apply_filters(self, channel=None):
+        channels = list(self.buses) if channel is None else [channel]
+        for name in channels:
+            filters = []
+            for table in (self.any_channel, self.dispatch[name]):
+                table_filters = table.filters()
+                if table_filters is None and table.has_subscriptions():
+                    filters = None        # a catch-all callback wants everything
+                    break
+                filters += table_filters or []
+            try:
+                self.buses[name].set_filters(filters or None)
+            except Exception as e:
+                log.warning("⚠️ Could not set CAN filters on %s: %s", name, e)
+
+    # ----------------------------------------------------------------
+    # Transmission
+    # ----------------------------------------------------------------
+    def send_message(self, channel, can_id, data):
+        """Send a CAN frame on one channel"""
+        bus = self.buses.get(channel)
+        if bus is None:
+            log.error("❌ Unknown CAN channel '%s'", channel)
+            return
+        try:
+            msg = can.Message(arbitration_id=can_id, data=bytearray(data), is_extended_id=False)
+            bus.send(msg)
+        except can.CanError as e:
+            log.error("❌ CAN send error on %s: %s", channel, e, extra={"category": ("tx error", channel)})
+
+    def close(self):
+        """Stop the reader thread and close every bus"""
+        self.running = False
+        os.write(self._wake_w, b"\0")
+        self.thread.join(timeout=1.0)
+        for channel, bus in self.buses.items():
+            try:
+                bus.shutdown()
+            except Exception as e:
+                log.warning("⚠️ Error while closing CAN bus %s: %s", channel, e)
+        self.buses.clear()
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        log.info("🛑 CAN buses closed cleanly.")
@@ -0,0 +1,315 @@
+# poll_scheduler.py
+"""Concurrent polling of several sensors within a bus-load budget.
+
+Each sensor is polled by its own periodic task (kernel BCM on socketcan, see
+CANInterface.start_periodic) at its own rate. Tasks are started at staggered
+offsets so that requests are spread over the fastest period instead of
+leaving in bursts. A change only restarts the tasks whose period or payload
+changed; the others keep running undisturbed. Rates are checked against the bus-load budget first: the
+load of every poll (request + reply, worst-case bit stuffing) is estimated
+from the frame sizes and the bitrate, and when the budget is exceeded the
+lowest-priority sensors are slowed down to their minimum rate, then
+suspended, until it fits.
+"""
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# Polled sensors: name -> (request ID, reply ID, reply DLC, default rate in Hz,
+# priority). Every sensor is polled all the time; when the bus-load budget is
+# exceeded the lowest priority ones are slowed down first.
+SENSORS = {
+    "MPU9250": (0x02, 0x08, 6, 100, 2),
+    "Anemometer": (0x03, 0x09, 1, 100, 1),
+    "VL6180X": (0x01, None, 8, 20, 0),      # reply not decoded yet
+}
+BITRATE = 500_000
+LOAD_BUDGET = 0.5   # fraction of the bitrate the polls may use
+
+FD_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+
+
+def frame_bits(length, extended=False, fd=False, data_ratio=1.0):
+    """Worst-case length on the wire of a CAN data frame, in nominal bit times.
+
+    Includes bit stuffing of the stuffed fields, EOF and interframe space.
+    For CAN FD the payload is rounded up to a valid FD length, and the data
+    phase (DLC to CRC) is divided by `data_ratio` = data bitrate / nominal
+    bitrate when bits are switched (BRS).
+    """
+    if not fd:
+        if extended:
+            return 67 + 8 * length + (54 + 8 * length - 1) // 4
+        return 47 + 8 * length + (34 + 8 * length - 1) // 4
+    length = next(n for n in FD_LENGTHS if n >= length)
+    arbitration = 36 if extended else 17            # SOF … BRS
+    arbitration += (arbitration - 1) // 4
+    crc = 17 if length <= 16 else 21
+    data = 1 + 4 + 8 * length + (5 + 8 * length - 1) // 4   # ESI, DLC, data + stuffing
+    data += 4 + crc + (4 + crc + 3) // 4                      # stuff count, CRC, fixed stuff bits
+    return arbitration + 12 + data / data_ratio              # + CRC delim, ACK, EOF, IFS
+
+
+class PolledSensor:
+    """A sensor answering a request frame, polled at `rate_hz`.
+
+    `reply_dlc` is only used for the load estimate (`reply_id` None: the
+    reply is not counted). Higher `priority` sensors are degraded last; the
+    rate is never lowered below `min_rate_hz` before the sensor is suspended.
+    """
+    def __init__(self, name, request_id, rate_hz, payload=(1,), reply_id=None, reply_dlc=8,
+                 priority=0, min_rate_hz=None, fd=False):
+        self.name = name
+        self.request_id = request_id
+        self.rate_hz = rate_hz
+        self.payload = list(payload)
+        self.reply_id = reply_id
+        self.reply_dlc = reply_dlc
+        self.priority = priority
+        self.min_rate_hz = rate_hz / 10 if min_rate_hz is None else min_rate_hz
+        self.fd = fd                  # CAN FD request and reply
+        self.paused = False           # request sent by someone else (e.g. motor_control)
+        self.effective_hz = rate_hz   # after degradation, 0 = suspended
+
+    def bits_per_poll(self, data_ratio=1.0):
+        bits = frame_bits(len(self.payload), self.request_id > 0x7FF, self.fd, data_ratio)
+        if self.reply_id is not None:
+            bits += frame_bits(self.reply_dlc, self.reply_id > 0x7FF, self.fd, data_ratio)
+        return bits
+
+
+class PollScheduler:
+    """Poll the registered sensors concurrently through `iface`.
+
+    `iface` is a CANInterface, or anything with its periodic-task API
+    (acquisition.RemoteCANInterface). `budget` is the fraction of the
+    bitrate the polls may use; `background_bps` accounts for other traffic.
+    `data_bitrate` is the CAN FD data-phase bitrate (default: `bitrate`).
+    """
+    def __init__(self, iface, bitrate=500_000, budget=0.5, background_bps=0.0, data_bitrate=None):
+        self.iface = iface
+        self.bitrate = bitrate
+        self.data_ratio = (data_bitrate or bitrate) / bitrate
+        self.budget = budget
+        self.background_bps = background_bps
+        self.sensors = {}        # request ID -> PolledSensor
+        self.running = False
+        self._timers = []
+        self._tasks = {}         # request ID -> (period, payload) of the started tasks
+        self._generation = 0     # invalidates the staggered starts of an older schedule
+        self._lock = threading.RLock()
+
+    # ----------------------------------------------------------------
+    # Configuration (reschedules when running)
+    # ----------------------------------------------------------------
+    def add(self, sensor):
+        with self._lock:
+            self.sensors[sensor.request_id] = sensor
+            self._reschedule()
+        return sensor
+
+    def remove(self, request_id):
+        with self._lock:
+            if self.sensors.pop(request_id, None) is not None:
+                self._reschedule()
+
+    def set_rate(self, request_id, rate_hz, min_rate_hz=None):
+        with self._lock:
+            sensor = self.sensors[request_id]
+            sensor.rate_hz = rate_hz
+            if min_rate_hz is not None:
+                sensor.min_rate_hz = min_rate_hz
+            self._reschedule()
+
+    def set_priority(self, request_id, priority):
+        with self._lock:
+            self.sensors[request_id].priority = priority
+            self._reschedule()
+
+    def pause(self, request_id):
+        """Stop polling a sensor without forgetting it (its load is freed)"""
+        with self._lock:
+            self.sensors[request_id].paused = True
+            self._reschedule()
+
+    def resume(self, request_id):
+        with self._lock:
+            self.sensors[request_id].paused = False
+            self._reschedule()
+
+    def set_payload(self, request_id, data):
+        """Change the request payload, without restarting the task if possible"""
+        with self._lock:
+            sensor = self.sensors[request_id]
+            resized = len(data) != len(sensor.payload)
+            sensor.payload = list(data)
+            if resized:                 # the load changes with the DLC
+                self._reschedule()
+            elif request_id in self._tasks:
+                self.iface.update_periodic(request_id, sensor.payload)
+                self._tasks[request_id] = (self._tasks[request_id][0], tuple(sensor.payload))
+
+    def polls(self):
+        """The requested polls: {request ID: (payload, period)}, paused sensors left out"""
+        with self._lock:
+            return {s.request_id: (list(s.payload), 1.0 / s.rate_hz)
+                    for s in self.sensors.values() if not s.paused}
+
+    def apply(self, polls):
+        """Bring the schedule to `polls` ({request ID: (payload, period)}).
+
+        Registered sensors missing from `polls` are paused, unknown request
+        IDs are added; only the tasks whose rate or payload changed restart.
+        """
+        with self._lock:
+            for request_id, sensor in self.sensors.items():
+                if request_id not in polls and not sensor.paused:
+                    self.pause(request_id)
+            for request_id, (payload, period) in polls.items():
+                sensor = self.sensors.get(request_id)
+                if sensor is None:
+                    self.add(PolledSensor(f"0x{request_id:X}", request_id, 1.0 / period, payload))
+                    continue
+                if abs(sensor.rate_hz * period - 1.0) > 1e-6:
+                    self.set_rate(request_id, 1.0 / period)
+                if list(payload) != sensor.payload:
+                    self.set_payload(request_id, payload)
+                if sensor.paused:
+                    self.resume(request_id)
+
+    # ----------------------------------------------------------------
+    # Load estimate and degradation
+    # ----------------------------------------------------------------
+    def load(self, requested=False):
+        """Estimated bus load (fraction of the bitrate) of the polls + background"""
+        bps = self.background_bps + sum(
+            (s.rate_hz if requested else s.effective_hz) * s.bits_per_poll(self.data_ratio)
+            for s in self.sensors.values() if not s.paused)
+        return bps / self.bitrate
+
+    def plan(self):
+        """Compute the effective rates fitting the budget, lowest priority degraded first"""
+        with self._lock:
+            for s in self.sensors.values():
+                s.effective_hz = 0 if s.paused else s.rate_hz
+            sensors = sorted((s for s in self.sensors.values() if not s.paused),
+                             key=lambda s: s.priority)
+            capacity = self.budget * self.bitrate - self.background_bps
+            excess = sum(s.rate_hz * s.bits_per_poll(self.data_ratio) for s in sensors) - capacity
+
+            # First slow sensors down to their minimum rate, then suspend them
+            for s in sensors:
+                if excess <= 0:
+                    break
+                bits = s.bits_per_poll(self.data_ratio)
+                reducible = (s.effective_hz - min(s.min_rate_hz, s.rate_hz)) * bits
+                cut = min(excess, reducible)
+                s.effective_hz -= cut / bits
+                excess -= cut
+            for s in sensors:
+                if excess <= 0:
+                    break
+                excess -= s.effective_hz * s.bits_per_poll(self.data_ratio)
+                s.effective_hz = 0
+            return self.load()
+
+    # ----------------------------------------------------------------
+    # Periodic tasks
+    # ----------------------------------------------------------------
+    def start(self):
+        with self._lock:
+            self.running = True
+            self._reschedule()
+
+    def stop(self):
+        with self._lock:
+            self.running = False
+            self._cancel_timers()
+            for request_id in self._tasks:
+                self.iface.stop_periodic(request_id)
+            self._tasks = {}
+
+    def detach(self):
+        """Stop scheduling but leave the started tasks to `iface`.
+
+        An acquisition process keeps polling after the GUI is gone; a
+        CANInterface stops its tasks when closed.
+        """
+        with self._lock:
+            self.running = False
+            self._cancel_timers()
+            self._tasks = {}
+
+    def _cancel_timers(self):
+        self._generation += 1
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+
+    def _reschedule(self):
+        self.plan()
+        if not self.running:
+            return
+        self._cancel_timers()   # starts still pending are planned again below
+        degraded = [s for s in self.sensors.values() if s.effective_hz < s.rate_hz and not s.paused]
+        if degraded:
+            log.warning("⚠️ Requested poll load %.0f%% exceeds the %.0f%% budget, degraded: %s",
+                        self.load(requested=True) * 100, self.budget * 100,
+                        ", ".join(f"{s.name} {s.effective_hz:.3g} Hz" for s in degraded))
+        active = sorted((s for s in self.sensors.values() if s.effective_hz > 0),
+                        key=lambda s: (-s.effective_hz, -s.priority))
+        for request_id in set(self._tasks) - {s.request_id for s in active}:
+            self.iface.stop_periodic(request_id)
+            del self._tasks[request_id]
+        changed = [s for s in active if self._tasks.get(s.request_id) != self._spec(s)]
+        if not changed:
+            return
+
+        # Spread the first requests over the fastest period; periodic tasks
+        # keep their relative phase afterwards
+        slot = 1.0 / active[0].effective_hz / len(changed)
+        generation = self._generation
+        for i, sensor in enumerate(changed):
+            self._set_tracked_period(sensor)
+            if i == 0:
+                self._start(sensor, generation)
+                continue
+            timer = threading.Timer(i * slot, self._start, (sensor, generation))
+            timer.daemon = True
+            self._timers.append(timer)
+            timer.start()
+        log.info("🗓️ Polling %s, estimated bus load %.1f%%",
+                 ", ".join(f"{s.name} {s.effective_hz:.3g} Hz" for s in active), self.load() * 100)
+
+    def _start(self, sensor, generation):
+        with self._lock:
+            if generation != self._generation or not self.running:
+                return
+            self.iface.start_periodic(sensor.request_id, sensor.payload, 1.0 / sensor.effective_hz)
+            self._tasks[sensor.request_id] = self._spec(sensor)
+
+    @staticmethod
+    def _spec(sensor):
+        return 1.0 / sensor.effective_hz, tuple(sensor.payload)
+
+    def _set_tracked_period(self, sensor):
+        # Keep the jitter statistics of CANInterface relative to the actual period
+        latency = getattr(self.iface, "latency", None)
+        if latency is not None:
+            latency.set_period(sensor.request_id, 1.0 / sensor.effective_hz)
+
+    def status(self):
+        """Rates and load estimate, for display"""
+        with self._lock:
+            return {
+                "bitrate": self.bitrate,
+                "budget": self.budget,
+                "load": self.load(),
+                "requested_load": self.load(requested=True),
+                "sensors": {
+                    s.request_id: {"name": s.name, "priority": s.priority, "rate_hz": s.rate_hz,
+                                   "effective_hz": s.effective_hz, "paused": s.paused}
+                    for s in self.sensors.values()
+                },
+            }
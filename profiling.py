@@ -0,0 +1,192 @@
+# profiling.py
+"""Hot-path instrumentation: per-handler timing and a sampling profiler.
+
+`timer` (a HandlerTimer) times CAN callbacks (DispatchTable.dispatch, reader
+thread) and GUI handlers (frame handlers, redraws) with `time.perf_counter`.
+It is off by default; when `timer.enabled` is False a timed call costs one
+attribute test. Each handler gets a call count and a latency histogram, and
+a call longer than `timer.budget` logs a warning, rate-limited per handler
+by bus_logging.
+
+`SamplingProfiler` records the Python stacks of chosen threads (the CAN reader,
+the GUI thread) every few milliseconds, from a thread of its own, so the
+profiled code is not modified. Its report lists where the samples fall, and
+`dump()` writes the stacks in the "folded" format read by flamegraph.pl or
+speedscope.
+
+    python main_ihm.py --profile --handler-budget 200   # F9: start/stop sampling
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from latency_stats import LatencyHistogram
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 200e-6   # s per handler call
+
+
+def handler_name(callback):
+    """Readable name of a callback, e.g. 'FrameBridge.push'"""
+    owner = getattr(callback, "__self__", None)
+    if owner is not None and hasattr(callback, "__func__"):
+        return f"{type(owner).__name__}.{callback.__func__.__name__}"
+    return getattr(callback, "__qualname__", None) or repr(callback)
+
+
+class HandlerStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.slow = 0             # calls over the budget
+        self.time = LatencyHistogram()
+
+    def snapshot(self):
+        return dict(self.time.snapshot(), name=self.name, calls=self.calls, slow=self.slow)
+
+
+class HandlerTimer:
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.enabled = False
+        self.budget = budget
+        self.handlers = {}        # name -> HandlerStats
+        self._names = {}          # callback -> name
+        self._lock = threading.Lock()
+
+    def call(self, name, fn, *args):
+        """Run `fn(*args)`, timed under `name` when enabled"""
+        if not self.enabled:
+            return fn(*args)
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def call_callback(self, callback, *args):
+        """Like call(), named after the callback"""
+        name = self._names.get(callback)
+        if name is None:
+            name = self._names[callback] = handler_name(callback)
+        return self.call(name, callback, *args)
+
+    def record(self, name, elapsed):
+        stats = self.handlers.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self.handlers.setdefault(name, HandlerStats(name))
+        stats.calls += 1
+        stats.time.add(elapsed)
+        if elapsed > self.budget:
+            stats.slow += 1
+            log.warning("🐢 %s took %.0f µs (budget %.0f µs)", name, elapsed * 1e6, self.budget * 1e6,
+                        extra={"category": f"slow {name}"})
+
+    def reset(self):
+        with self._lock:
+            self.handlers = {}
+
+    def snapshot(self):
+        """{name: stats}, slowest (p99) first"""
+        stats = [s.snapshot() for s in list(self.handlers.values())]
+        stats.sort(key=lambda s: -(s["p99"] or 0))
+        return {s["name"]: s for s in stats}
+
+    def report(self):
+        lines = [f"⏱️ Handler timing (budget {self.budget * 1e6:.0f} µs):",
+                 f"  {'calls':>9} {'slow':>7} {'p50 µs':>8} {'p99 µs':>8} {'max µs':>8}  handler"]
+        for name, s in self.snapshot().items():
+            lines.append(f"  {s['calls']:9d} {s['slow']:7d} {_us(s['p50'])} {_us(s['p99'])} {_us(s['max'])}  {name}")
+        return "\n".join(lines)
+
+
+def _us(value):
+    return f"{'–':>8}" if value is None else f"{value * 1e6:8.1f}"
+
+
+timer = HandlerTimer()
+
+
+# ================================================================
+# Sampling profiler
+# ================================================================
+class SamplingProfiler:
+    """Sample the stacks of `threads` ({label: threading.Thread}) every `interval` s"""
+    def __init__(self, threads, interval=0.002, max_depth=64):
+        self.threads = {label: t.ident for label, t in threads.items() if t is not None and t.ident}
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()   # (label, frame keys root first) -> samples
+        self.samples = 0
+        self.started = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        log.warning("🔬 Sampling %s every %g ms", ", ".join(self.threads), self.interval * 1000)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.duration = time.perf_counter() - self.started
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._stop.is_set()
+
+    def _run(self):
+        threads = list(self.threads.items())
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for label, ident in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append((os.path.basename(code.co_filename), code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[(label, tuple(reversed(stack)))] += 1
+            self.samples += 1
+            del frames
+
+    def report(self, top=15):
+        """Functions by own samples (where the time is spent) and inclusive samples"""
+        lines = [f"🔬 Sampling profile: {self.samples} samples over {self.duration:.1f} s"]
+        for label in self.threads:
+            own, inclusive, total = Counter(), Counter(), 0
+            for (thread, stack), n in self.stacks.items():
+                if thread != label:
+                    continue
+                total += n
+                own[stack[-1]] += n
+                for key in set(stack):
+                    inclusive[key] += n
+            lines.append(f"  [{label}] {total} samples")
+            if not total:
+                continue
+            lines.append(f"    {'own %':>6} {'incl %':>6}  function")
+            for key, n in own.most_common(top):
+                lines.append(f"    {100 * n / total:6.1f} {100 * inclusive[key] / total:6.1f}  {_frame(key)}")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Write the stacks in folded format ('thread;f1;f2 count' per line)"""
+        with open(path, "w") as f:
+            for (label, stack), n in self.stacks.most_common():
+                f.write(";".join([label] + [_frame(key) for key in stack]) + f" {n}\n")
+        return path
+
+
+def _frame(key):
+    filename, line, name = key
+    return f"{name} ({filename}:{line})"
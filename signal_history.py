@@ -0,0 +1,129 @@
+# signal_history.py
+"""Bounded time series of decoded signals, for trend plots."""
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity (timestamp, value) series, oldest samples overwritten.
+
+    One writer (the CAN receive thread), any number of readers. Timestamps
+    are expected to increase, which lets `window()` use binary search.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.t = np.zeros(capacity)
+        self.v = np.zeros(capacity)
+        self.head = 0   # samples ever written
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    def append(self, t, value):
+        i = self.head % self.capacity
+        self.t[i] = t
+        self.v[i] = value
+        self.head += 1
+
+    def extend(self, t, values):
+        """Append arrays of samples at once"""
+        n = len(t)
+        if n > self.capacity:
+            t, values = t[-self.capacity:], values[-self.capacity:]
+            self.head += n - self.capacity
+            n = self.capacity
+        i = self.head % self.capacity
+        first = min(n, self.capacity - i)
+        self.t[i:i + first] = t[:first]
+        self.v[i:i + first] = values[:first]
+        self.t[:n - first] = t[first:]
+        self.v[:n - first] = values[first:]
+        self.head += n
+
+    def _segments(self):
+        """Buffer slices in chronological order"""
+        head = self.head
+        if head <= self.capacity:
+            return [slice(0, head)]
+        i = head % self.capacity
+        return [slice(i, self.capacity), slice(0, i)]
+
+    def window(self, t0=None, t1=None):
+        """Samples with t0 <= t <= t1 (whole history if None), as new arrays"""
+        ts, vs = [], []
+        for sl in self._segments():
+            seg_t = self.t[sl]
+            i0 = 0 if t0 is None else np.searchsorted(seg_t, t0, "left")
+            i1 = len(seg_t) if t1 is None else np.searchsorted(seg_t, t1, "right")
+            ts.append(seg_t[i0:i1])
+            vs.append(self.v[sl][i0:i1])
+        return np.concatenate(ts), np.concatenate(vs)
+
+    def time_span(self):
+        """(first, last) timestamp, or None if empty"""
+        if not self.head:
+            return None
+        segments = self._segments()
+        return self.t[segments[0].start], self.t[(self.head - 1) % self.capacity]
+
+
+def minmax_decimate(t, y, n_bins):
+    """Reduce a series to the min and max of `n_bins` bins.
+
+    Keeps every peak visible on screen (2 points per pixel column is all a
+    line plot can show) while drawing at most 2 * n_bins points.
+    """
+    n = len(t)
+    if n <= 2 * n_bins:
+        return t, y
+    # ceil-sized bins, the last one shorter: every sample, the newest
+    # included, falls in a bin
+    per_bin = -(-n // n_bins)
+    starts = np.arange(0, n, per_bin)
+    t_out = np.repeat(t[starts], 2)
+    y_out = np.empty(2 * len(starts))
+    y_out[0::2] = np.minimum.reduceat(y, starts)
+    y_out[1::2] = np.maximum.reduceat(y, starts)
+    return t_out, y_out
+
+
+class SignalHistory:
+    """One RingBuffer per signal, fed by CANInterface callbacks.
+
+    The default capacity holds one hour at 100 Hz (~5.8 MB per signal).
+    """
+    def __init__(self, capacity=360_000):
+        self.capacity = capacity
+        self.buffers = {}   # signal name -> RingBuffer
+
+    def buffer(self, name):
+        buf = self.buffers.get(name)
+        if buf is None:
+            buf = self.buffers[name] = RingBuffer(self.capacity)
+        return buf
+
+    def attach(self, iface, definition):
+        """Record every signal of a can_signals.MessageDef received on `iface`.
+
+        Frames carrying several packed samples (CAN FD) are decoded in one
+        pass, each sample with its own timestamp.
+        """
+        buffers = [(name, self.buffer(name)) for name in definition.names]
+        targets = [buf.append for _, buf in buffers]
+        length = definition.length
+        decode = definition.decode_values
+
+        def on_frame(msg):
+            size = len(msg.data)
+            if size < length:
+                return
+            if size < 2 * length:
+                t = msg.timestamp
+                for append, value in zip(targets, decode(msg.data)):
+                    append(t, value)
+                return
+            t, values = definition.decode_samples(msg.data, msg.timestamp)
+            for name, buf in buffers:
+                buf.extend(t, values[name])
+
+        iface.add_callback(on_frame, can_id=definition.can_id)
+        return on_frame
@@ -0,0 +1,41 @@
+# startup_timing.py
+"""Startup cost measurement of the dashboard.
+
+Import this module first: its import time is the origin. Costs are always
+collected (a perf_counter call each), `report()` only logs them when
+`enabled` is set, e.g. by `python main_ihm.py --startup-profile`.
+For a per-module breakdown of the imports use `python -X importtime`.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+T0 = time.perf_counter()
+enabled = False
+events = []   # (label, start since T0, duration), in seconds
+
+
+@contextmanager
+def timed(label):
+    """Measure the block (import, widget construction …)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        events.append((label, start - T0, time.perf_counter() - start))
+
+
+def mark(label):
+    """Record a point in time (e.g. 'window shown')"""
+    events.append((label, time.perf_counter() - T0, 0.0))
+
+
+def report(title="Startup"):
+    if not enabled:
+        return
+    lines = [f"⏱️ {title} (ms since start / duration):"]
+    for label, start, duration in events:
+        lines.append(f"  {start * 1000:8.1f}  {duration * 1000:8.1f}  {label}")
+    log.warning("\n".join(lines))
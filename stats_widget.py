@@ -0,0 +1,55 @@
+# stats_widget.py
+from PyQt5 import QtWidgets, QtCore
+
+from latency_stats import format_ms
+from view_model import is_shown
+
+COLUMNS = ("Requests", "Replies", "Missed", "Loss %",
+           "p50 ms", "p95 ms", "p99 ms", "max ms", "Jitter p95 ms")
+
+
+class LatencyStatsWidget(QtWidgets.QWidget):
+    """Small table of the round-trip statistics of each polled sensor.
+
+    `source` is a callable returning CANInterface.latency_stats(); it is read
+    every `refresh_ms` while the widget is shown, never per frame, and only
+    the cells whose text changed are replaced.
+    """
+    def __init__(self, source, refresh_ms=500):
+        super().__init__()
+        self.source = source
+        self._cells = {}          # (row, column) -> text shown, column -1: header
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.table = QtWidgets.QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        self.table.setMaximumHeight(120)
+        layout.addWidget(self.table)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(refresh_ms)
+
+    def refresh(self):
+        if not is_shown(self):
+            return
+        stats = self.source()
+        if self.table.rowCount() != len(stats):
+            self.table.setRowCount(len(stats))
+            self._cells = {}
+        for row, (can_id, s) in enumerate(sorted(stats.items())):
+            header = f"0x{can_id:X} → 0x{s['reply_id']:X}"
+            if self._cells.get((row, -1)) != header:
+                self.table.setVerticalHeaderItem(row, QtWidgets.QTableWidgetItem(header))
+                self._cells[(row, -1)] = header
+            lat, jit = s["latency"], s["jitter"]
+            values = (s["requests"], s["replies"], s["missed"], f"{s['loss'] * 100:.1f}",
+                      *(format_ms(lat[q]) for q in ("p50", "p95", "p99", "max")), format_ms(jit["p95"]))
+            for col, value in enumerate(values):
+                text = str(value)
+                if self._cells.get((row, col)) != text:
+                    self.table.setItem(row, col, QtWidgets.QTableWidgetItem(text))
+                    self._cells[(row, col)] = text
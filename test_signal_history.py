@@ -0,0 +1,31 @@
+# test_signal_history.py
+import numpy as np
+
+from signal_history import minmax_decimate
+
+
+def test_minmax_decimate_keeps_newest_sample():
+    # 1003 samples in 100 bins: 3 samples past a whole number of bins
+    t = np.arange(1003, dtype=float)
+    y = np.zeros(1003)
+    y[-1] = 5.0
+    t_out, y_out = minmax_decimate(t, y, 100)
+    assert len(y_out) <= 200
+    assert y_out.max() == 5.0
+    assert t_out[-1] <= t[-1]
+
+
+def test_minmax_decimate_keeps_peaks():
+    t = np.arange(1000, dtype=float)
+    y = np.sin(t / 50.0)
+    y[437] = -3.0
+    t_out, y_out = minmax_decimate(t, y, 100)
+    assert len(t_out) == len(y_out) == 200
+    assert y_out.min() == -3.0
+    assert y_out.max() == y.max()
+
+
+def test_minmax_decimate_short_series_unchanged():
+    t = np.arange(10, dtype=float)
+    t_out, y_out = minmax_decimate(t, t, 100)
+    assert t_out is t and y_out is t
@@ -0,0 +1,154 @@
+# tx_queue.py
+"""Transmit thread of CANInterface.
+
+Callers only enqueue (never block on the socket). Pending frames are kept
+in a bounded priority queue:
+
+- latest wins: a frame queued for an ID that already has one pending replaces
+  its payload in place (same position in the queue), so a dragged slider
+  sends its newest value and not every intermediate one;
+- PRIORITY_HIGH frames go out before PRIORITY_NORMAL ones, FIFO within a
+  priority;
+- one `can.Message` per ID is built once and reused for every send (CAN FD
+  with bitrate switching when `fd` is set);
+- ENOBUFS (socketcan TX queue full) is retried with exponential backoff.
+"""
+import errno
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+import can
+
+log = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0     # time-critical (e.g. motor stop)
+PRIORITY_NORMAL = 1
+
+
+class TxQueue:
+    def __init__(self, bus, capacity=256, max_retries=8, backoff=0.0005, max_backoff=0.02, fd=False):
+        self.bus = bus
+        self.fd = fd
+        self.capacity = capacity
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._heap = []           # [priority, seq, can_id, data, valid]
+        self._pending = {}        # CAN ID -> heap entry (coalescable frames only)
+        self._seq = itertools.count()
+        self._messages = {}       # CAN ID -> reusable can.Message (TX thread only)
+        self._cond = threading.Condition()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0          # queue full, or retries exhausted
+        self.retries = 0
+        self.errors = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, can_id, data, priority=PRIORITY_NORMAL, coalesce=True):
+        """Queue a frame; returns False if it was dropped (queue full)"""
+        data = bytes(data)
+        with self._cond:
+            entry = self._pending.get(can_id) if coalesce else None
+            if entry is not None and entry[0] <= priority:
+                entry[3] = data           # latest wins, keeps its place
+                self.coalesced += 1
+                return True
+            if entry is not None:         # now more urgent: requeue ahead
+                entry[4] = False
+                self.coalesced += 1
+            elif len(self._heap) >= self.capacity and not self._compact():
+                self.dropped += 1
+                log.warning("⚠️ TX queue full, frame ID=0x%X dropped", can_id,
+                            extra={"category": ("tx dropped", can_id)})
+                return False
+            entry = [priority, next(self._seq), can_id, data, True]
+            heapq.heappush(self._heap, entry)
+            if coalesce:
+                self._pending[can_id] = entry
+            self._cond.notify()
+        return True
+
+    def _compact(self):
+        """Purge replaced entries, True if room was made"""
+        self._heap = [e for e in self._heap if e[4]]
+        heapq.heapify(self._heap)
+        return len(self._heap) < self.capacity
+
+    def _next(self):
+        with self._cond:
+            while self.running:
+                while self._heap:
+                    entry = heapq.heappop(self._heap)
+                    if not entry[4]:
+                        continue
+                    if self._pending.get(entry[2]) is entry:
+                        del self._pending[entry[2]]
+                    return entry[2], entry[3]
+                self._cond.wait()
+        return None
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            self._send(*item)
+
+    def _send(self, can_id, data):
+        msg = self._messages.get(can_id)
+        if msg is None:
+            msg = self._messages[can_id] = can.Message(
+                arbitration_id=can_id, is_extended_id=can_id > 0x7FF,
+                is_fd=self.fd, bitrate_switch=self.fd)
+        msg.data[:] = data        # resized in place: the frame length is len(data)
+        msg.dlc = len(data)
+
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.bus.send(msg)
+            except can.CanOperationError as e:
+                if e.error_code == errno.ENOBUFS and attempt < self.max_retries and self.running:
+                    self.retries += 1
+                    time.sleep(delay)
+                    delay = min(2 * delay, self.max_backoff)
+                    continue
+                self.errors += 1
+                self.dropped += 1
+                log.error("❌ CAN send error ID=0x%X: %s", can_id, e, extra={"category": "tx error"})
+                return
+            except Exception as e:
+                self.errors += 1
+                self.dropped += 1
+                log.error("❌ General CAN send error: %s", e, extra={"category": "tx error"})
+                return
+            self.sent += 1
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("✅ Sent CAN frame ID=0x%X, Data=%s", can_id, list(data),
+                         extra={"category": ("tx", can_id)})
+            return
+
+    def stats(self):
+        with self._cond:
+            queued = sum(1 for e in self._heap if e[4])
+        return {"queued": queued, "sent": self.sent, "coalesced": self.coalesced,
+                "dropped": self.dropped, "retries": self.retries, "errors": self.errors}
+
+    def close(self, timeout=0.5):
+        """Send what is still queued (up to `timeout` s), then stop the thread"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not any(e[4] for e in self._heap):
+                    break
+            time.sleep(0.005)
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        self.thread.join(timeout=1.0)
@@ -0,0 +1,121 @@
+# view_model.py
+"""Decoded values shared by the dashboard views, and their refresh loop.
+
+Frame handlers only store decoded values in a SignalModel. A value within
+the deadband of the stored one is dropped, so a steady sensor costs no
+repaint; a slow drift is still shown once it adds up to more than the
+deadband.
+
+RefreshLoop is the single display clock (60 Hz). Each tick it runs its
+`before_render` callbacks (FrameBridge.drain: frames are decoded at the
+display rate), then calls the render function of each bound view whose
+values changed, and only if that view is shown. Hidden views (inactive pages
+of MainIHM.view_stack, minimized window) stay dirty and are rendered on the
+first tick after they are shown. Idle ticks only compare a few flags.
+"""
+from PyQt5 import QtCore
+
+import profiling
+
+
+def is_shown(widget):
+    """True if the widget is on screen (visible page, window not minimized)"""
+    return widget.isVisible() and not widget.window().isMinimized()
+
+
+class SignalModel:
+    """Latest displayed value per key, with per-key deadbands"""
+    def __init__(self, deadbands=None):
+        self.values = {}
+        self.deadbands = dict(deadbands or {})   # key -> deadband, 0: any change
+        self.updates = 0          # set() calls
+        self.changes = 0          # of which beyond the deadband
+        self._changed = set()
+
+    def set_deadband(self, key, deadband):
+        self.deadbands[key] = deadband
+
+    def set(self, key, value):
+        """Store a value (number or tuple); False if within the deadband of the stored one"""
+        self.updates += 1
+        old = self.values.get(key)
+        if old is not None and not self._exceeds(old, value, self.deadbands.get(key, 0)):
+            return False
+        self.values[key] = value
+        self._changed.add(key)
+        self.changes += 1
+        return True
+
+    @staticmethod
+    def _exceeds(old, new, deadband):
+        if not deadband:
+            return new != old
+        if isinstance(new, tuple):
+            return any(abs(a - b) > deadband for a, b in zip(old, new))
+        return abs(new - old) > deadband
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def take_changed(self):
+        """Keys changed since the previous call"""
+        changed, self._changed = self._changed, set()
+        return changed
+
+
+class Binding:
+    def __init__(self, widget, keys, render):
+        self.widget = widget
+        self.keys = tuple(keys)
+        self.render = render
+        self.dirty = True
+        self.renders = 0
+
+
+class RefreshLoop(QtCore.QObject):
+    def __init__(self, model, rate_hz=60, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.bindings = []
+        self._before = []
+        self.ticks = 0
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.set_rate(rate_hz)
+        self.timer.start()
+
+    def set_rate(self, rate_hz):
+        self.timer.setInterval(max(1, int(round(1000.0 / rate_hz))))
+
+    def before_render(self, callback):
+        """Run `callback()` at the start of every tick (e.g. FrameBridge.drain)"""
+        self._before.append(callback)
+
+    def bind(self, widget, keys, render):
+        """Call `render(*values of keys)` when one of them changed and `widget` is shown"""
+        binding = Binding(widget, keys, render)
+        self.bindings.append(binding)
+        return binding
+
+    def unbind(self, widget):
+        self.bindings = [b for b in self.bindings if b.widget is not widget]
+
+    def tick(self):
+        self.ticks += 1
+        for callback in self._before:
+            callback()
+        changed = self.model.take_changed()
+        for b in self.bindings:
+            if changed and not b.dirty and not changed.isdisjoint(b.keys):
+                b.dirty = True
+            if not b.dirty or not is_shown(b.widget):
+                continue
+            values = [self.model.get(key) for key in b.keys]
+            if None in values:
+                continue          # nothing received yet
+            b.dirty = False
+            b.renders += 1
+            profiling.timer.call_callback(b.render, *values)
+
+    def stop(self):
+        self.timer.stop()